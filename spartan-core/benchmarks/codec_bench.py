@@ -0,0 +1,82 @@
+"""
+Micro benchmark of the document codec.
+
+    cd spartan-core
+    python -m benchmarks.codec_bench
+"""
+import timeit
+from datetime import datetime
+
+from bson import ObjectId
+
+from data.models import codec
+from data.models.idea import IdeaList, IdeaRead
+
+NUMBER = 20_000
+PAGE_SIZE = 100
+
+
+def legacy_convert(doc: dict) -> dict:
+    # convert() as it was implemented before the codec
+    data = {}
+    for k, v in doc.items():
+        data[k] = legacy_convert_type(v)
+
+    if '_id' in data:
+        data['id'] = data['_id']
+        del data['_id']
+    return data
+
+
+def legacy_convert_type(stype):
+    if isinstance(stype, str) or isinstance(stype, int) or isinstance(stype, datetime):
+        return stype
+    elif isinstance(stype, dict):
+        return {k: legacy_convert_type(v) for k, v in stype.items()}
+    elif isinstance(stype, list) or isinstance(stype, set):
+        return [legacy_convert_type(x) for x in stype]
+    elif isinstance(stype, ObjectId):
+        return str(stype)
+    elif stype is None:
+        return stype
+    else:
+        return str(stype)
+
+
+def idea_document() -> dict:
+    now = datetime.now()
+    return {
+        '_id': ObjectId(), 'correlation_id': None, 'name': 'benchmark idea',
+        'content': 'lorem ipsum dolor sit amet ' * 40, 'tags': ['a', 'b', 'c', 'd'],
+        'project': 'spartan', 'area': None, 'resource': None, 'archive': None,
+        'hash': 'e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855', 'hash_type': 'sha256',
+        'size': 1080, 'attributes': {'source': 'bench', 'owner_id': ObjectId(), 'scores': [1, 2, 3]},
+        'created_ts': now, 'modified_ts': now
+    }
+
+
+def run():
+    doc = idea_document()
+    cases = {
+        'legacy convert': lambda: legacy_convert(doc),
+        'codec.decode': lambda: codec.decode(doc),
+        'legacy convert + IdeaRead + json': lambda: IdeaRead(**legacy_convert(doc)).model_dump_json(),
+        'codec.decode + IdeaRead + json': lambda: IdeaRead(**codec.decode(doc)).model_dump_json(),
+        'codec.encode_document': lambda: codec.encode_document(doc),
+    }
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=NUMBER, repeat=5))
+        print(f"{name:<36} {seconds / NUMBER * 1_000_000:8.2f} us/doc")
+
+    page = [idea_document() for _ in range(PAGE_SIZE)]
+    pages = {
+        'IdeaList page (validated)': lambda: IdeaList(data=[IdeaRead(**codec.decode(d)) for d in page]).model_dump_json(),
+        'DocumentResponse page (trusted)': lambda: codec.DocumentResponse({'data': [codec.to_document(d) for d in page]}),
+    }
+    for name, case in pages.items():
+        seconds = min(timeit.repeat(case, number=NUMBER // PAGE_SIZE, repeat=5))
+        print(f"{name:<36} {seconds / (NUMBER // PAGE_SIZE) * 1_000:8.2f} ms/page of {PAGE_SIZE}")
+
+
+if __name__ == '__main__':
+    run()
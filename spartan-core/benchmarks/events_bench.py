@@ -0,0 +1,294 @@
+"""
+Benchmark of the change event pipeline (create_event -> encoder -> publisher -> checkpoint).
+
+Synthetic change documents are replayed through events/main.py with an in-memory stand-in for the kafka producer:
+
+    cd spartan-core
+    python -m benchmarks.events_bench --events 50000 --encoding all
+
+With --mongodb the events are read from a real change stream instead. This needs a replica set, documents are
+written to the 'ideas' collection of the 'spartan_bench' database, which is dropped first:
+
+    python -m benchmarks.events_bench --mongodb "mongodb://localhost:27017/?replicaSet=rs0" --events 5000
+"""
+import argparse
+import copy
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+# the events daemon is run from its own directory and uses absolute imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'events'))
+
+import main as events  # noqa: E402
+from encoders import ENCODERS, get_encoder  # noqa: E402
+from model.event import ChangeEvent  # noqa: E402
+from publisher import Publisher  # noqa: E402
+
+COLLECTIONS = ['ideas', 'files', 'labels', 'entities', 'references', 'sources']
+BENCH_DB_NAME = 'spartan_bench'
+
+
+class BenchmarkDone(Exception):
+    pass
+
+
+class MemoryMessage:
+    def __init__(self, topic: str, key, value: bytes, offset: int):
+        self._topic = topic
+        self._key = key
+        self._value = value
+        self._offset = offset
+        self.produced = time.perf_counter()
+
+    def topic(self):
+        return self._topic
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def offset(self):
+        return self._offset
+
+
+class MemoryProducer:
+    """Stand-in for the kafka producer, messages are delivered on poll/flush after delivery_latency seconds."""
+
+    def __init__(self, delivery_latency: float = 0.0, limit: int | None = None):
+        self._delivery_latency = delivery_latency
+        self._limit = limit
+        self._queue = deque()
+        self.messages = 0
+        self.bytes = 0
+        self.delivered = []
+
+    def produce(self, topic, value, key=None, headers=None, on_delivery=None):
+        msg = MemoryMessage(topic, key, value, self.messages)
+        self._queue.append((msg.produced + self._delivery_latency, on_delivery, msg))
+        self.messages += 1
+        self.bytes += len(value)
+        if self._limit is not None and self.messages >= self._limit:
+            raise BenchmarkDone()
+
+    def poll(self, timeout: float = 0):
+        now = time.perf_counter()
+        n = 0
+        while len(self._queue) > 0 and self._queue[0][0] <= now:
+            _, on_delivery, msg = self._queue.popleft()
+            self.delivered.append((msg, time.perf_counter()))
+            if on_delivery is not None:
+                on_delivery(None, msg)
+            n += 1
+        return n
+
+    def flush(self, timeout: float | None = None) -> int:
+        while len(self._queue) > 0:
+            time.sleep(max(self._queue[0][0] - time.perf_counter(), 0))
+            self.poll()
+        return 0
+
+
+class ReplayStream:
+    def __init__(self, changes: list):
+        self._changes = iter(changes)
+        self.alive = True
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.alive = False
+
+    def try_next(self):
+        try:
+            change = next(self._changes)
+        except StopIteration:
+            self.alive = False
+            return None
+        self.resume_token = change['_id']
+        return change
+
+
+class ReplayDatabase:
+    """Just enough of a pymongo database for process_change_events, the watch replays the given changes."""
+
+    def __init__(self, changes: list):
+        self._changes = changes
+
+    def __getitem__(self, name: str):
+        return self
+
+    def find_one(self, *args, **kwargs):
+        return None
+
+    def watch(self, pipeline=None, **kwargs):
+        return ReplayStream(self._changes)
+
+
+def change_documents(n: int) -> list:
+    """Change events as they are sent after the $project of the stream pipeline: 60% inserts, 30% updates."""
+    changes = []
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    for i in range(n):
+        doc_id = ObjectId()
+        change = {'_id': {'_data': f"{i:032x}"}, 'ns': {'coll': COLLECTIONS[i % len(COLLECTIONS)]},
+                  'documentKey': {'_id': doc_id}, 'wallTime': now}
+        if i % 10 < 6:
+            change['operationType'] = 'insert'
+            change['fullDocument'] = {
+                '_id': doc_id, 'idea_id': ObjectId(), 'name': f"benchmark {i}", 'content': 'lorem ipsum ' * 20,
+                'tags': ['a', 'b'], 'project': 'spartan', 'created_ts': now, 'modified_ts': now
+            }
+        elif i % 10 < 9:
+            change['operationType'] = 'update'
+            change['updateDescription'] = {'updatedFields': {'name': f"renamed {i}", 'modified_ts': now}}
+        else:
+            change['operationType'] = 'delete'
+        changes.append(change)
+    return changes
+
+
+def percentiles(values: list) -> str:
+    if len(values) == 0:
+        return "-"
+    values = sorted(values)
+    p = [values[min(int(len(values) * q), len(values) - 1)] for q in (0.5, 0.99)]
+    return f"p50 {p[0] * 1_000_000:8.2f} us  p99 {p[1] * 1_000_000:8.2f} us"
+
+
+def bench_stages(changes: list, encoding: str, delivery_latency: float):
+    """Times every stage of the pipeline separately."""
+    producer = MemoryProducer(delivery_latency)
+    tokens = []
+    publisher = Publisher(producer, tokens.append)
+    encoder = get_encoder(encoding)
+    stages = {'create_event': [], 'encode': [], 'publish': []}
+    # create_message drops the _id of the documents in place, the shared changes are left as they are
+    for change in copy.deepcopy(changes):
+        t0 = time.perf_counter()
+        # the same path as process_change_events, the model is only built for the encoders that need it
+        message = events.create_message(change)
+        event = message if encoder.from_message else ChangeEvent(**message)
+        t1 = time.perf_counter()
+        value = encoder.encode(event)
+        t2 = time.perf_counter()
+        publisher.publish("spartan.events." + message['context'], message['id'], value, change['_id'])
+        t3 = time.perf_counter()
+        stages['create_event'].append(t1 - t0)
+        stages['encode'].append(t2 - t1)
+        stages['publish'].append(t3 - t2)
+    publisher.close()
+    for name, values in stages.items():
+        print(f"  {name:<14} {percentiles(values)}")
+
+
+def bench_pipeline(changes: list, encoding: str, delivery_latency: float):
+    """Runs process_change_events end to end over the replayed changes."""
+    def replay(replay_changes: list):
+        replay_producer = MemoryProducer(delivery_latency)
+        replay_tokens = []
+        replay_publisher = Publisher(replay_producer, replay_tokens.append)
+        events.process_change_events(ReplayDatabase(replay_changes), replay_publisher, get_encoder(encoding))
+        replay_publisher.close()
+        return replay_producer, replay_tokens
+
+    # create_message drops the _id of the documents in place, every run replays its own copy. The copies are made
+    # up front, so they are neither timed nor traced
+    first, second = copy.deepcopy(changes), copy.deepcopy(changes)
+    start = time.perf_counter()
+    producer, tokens = replay(first)
+    seconds = time.perf_counter() - start
+
+    # a second run for the memory, tracing slows the pipeline down
+    tracemalloc.start()
+    replay(second)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    lag = [delivered - msg.produced for msg, delivered in producer.delivered]
+    print(f"  {'throughput':<14} {len(changes) / seconds:10.0f} events/s, "
+          f"{producer.bytes / len(changes):6.1f} bytes/event, {len(tokens)} checkpoints")
+    print(f"  {'delivery lag':<14} {percentiles(lag)}")
+    print(f"  {'peak memory':<14} {peak / 1024 / 1024:8.2f} MiB")
+
+
+def bench_mongodb(url: str, n: int, encoding: str, delivery_latency: float):
+    """Measures the lag from the insert into mongodb to the delivery of the event."""
+    from pymongo import MongoClient
+
+    client = MongoClient(url)
+    client.drop_database(BENCH_DB_NAME)
+    db = client[BENCH_DB_NAME]
+    with db['ideas'].watch(events.get_pipeline('ideas')) as stream:
+        events.store_token(stream.resume_token, db, 'ideas')
+
+    inserted = {}
+
+    def write():
+        for i in range(n):
+            doc_id = ObjectId()
+            inserted[str(doc_id)] = time.perf_counter()
+            db['ideas'].insert_one({'_id': doc_id, 'name': f"benchmark {i}", 'content': 'lorem ipsum ' * 20})
+
+    producer = MemoryProducer(delivery_latency, limit=n)
+    publisher = Publisher(producer, lambda token: events.store_token(token, db, 'ideas'))
+    writer = threading.Thread(target=write)
+    start = time.perf_counter()
+    writer.start()
+    try:
+        events.process_change_events(db, publisher, get_encoder(encoding), 'ideas')
+    except BenchmarkDone:
+        pass
+    publisher.close()
+    seconds = time.perf_counter() - start
+    writer.join()
+
+    lag = [delivered - inserted[msg.key()] for msg, delivered in producer.delivered if msg.key() in inserted]
+    print(f"  {'throughput':<14} {n / seconds:10.0f} events/s (bounded by the writer)")
+    print(f"  {'insert->deliv.':<14} {percentiles(lag)}")
+    client.drop_database(BENCH_DB_NAME)
+    client.close()
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=20_000)
+    parser.add_argument('--encoding', default='all', choices=['all', *ENCODERS.keys()])
+    parser.add_argument('--delivery-latency-ms', type=float, default=5.0,
+                        help="simulated broker round trip of the in-memory producer")
+    parser.add_argument('--mongodb', default=None, help="url of a replica set, enables the change stream benchmark")
+    args = parser.parse_args()
+
+    # the daemon logs every event on debug level
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("spartan").setLevel(logging.WARNING)
+
+    encodings = list(ENCODERS.keys()) if args.encoding == 'all' else [args.encoding]
+    latency = args.delivery_latency_ms / 1000
+    changes = change_documents(args.events)
+    for encoding in encodings:
+        try:
+            get_encoder(encoding)
+        except ImportError as ex:
+            print(f"{encoding}: skipped, {ex}")
+            continue
+        print(f"{encoding}: {args.events} events")
+        bench_stages(changes, encoding, latency)
+        bench_pipeline(changes, encoding, latency)
+        if args.mongodb is not None:
+            bench_mongodb(args.mongodb, args.events, encoding, latency)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,78 @@
+import logging
+from collections import defaultdict
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from .models.bulk import BulkItemResult, BulkResult
+from .models.error import ErrorResponseMessage
+
+logger = logging.getLogger("spartan." + __name__)
+
+
+class BulkItem:
+    def __init__(self, index: int):
+        self.index = index
+        self.document = None
+        self.parents = []
+        self.status = None
+        self.error = None
+
+    def add_parent(self, collection: str, field: str, parent_id: ObjectId):
+        self.parents.append((collection, field, parent_id))
+
+    def fail(self, status: int, error: ErrorResponseMessage):
+        self.status = status
+        self.error = error
+
+    def is_valid(self) -> bool:
+        return self.error is None and self.document is not None
+
+    def to_result(self) -> BulkItemResult:
+        if self.is_valid():
+            return BulkItemResult(index=self.index, status=200, id=str(self.document['_id']))
+        return BulkItemResult(index=self.index, status=self.status, error=self.error)
+
+
+async def _existing_parents(db, items: list[BulkItem]) -> dict:
+    wanted = defaultdict(set)
+    for item in items:
+        for collection, _, parent_id in item.parents:
+            wanted[collection].add(parent_id)
+
+    # one $in query per parent collection instead of one find_one per item
+    existing = {}
+    for collection, ids in wanted.items():
+        found = db[collection].find({'_id': {'$in': list(ids)}}, {'_id': 1})
+        existing[collection] = {f['_id'] async for f in found}
+    return existing
+
+
+async def insert_bulk(db, collection: str, items: list[BulkItem]) -> BulkResult:
+    existing = await _existing_parents(db, [i for i in items if i.is_valid()])
+    for item in items:
+        for parent_collection, field, parent_id in item.parents:
+            if item.is_valid() and parent_id not in existing[parent_collection]:
+                item.fail(404, ErrorResponseMessage(
+                    error="ID_ERROR",
+                    message=f"ID does not exist",
+                    detail=f"{field} '{parent_id}' does not exist"
+                ))
+
+    valid = [i for i in items if i.is_valid()]
+    if len(valid) > 0:
+        try:
+            # insert_many sets the generated _id on every document
+            await db[collection].insert_many([i.document for i in valid], ordered=False)
+        except BulkWriteError as ex:
+            logger.warning(f"bulk insert into '{collection}' failed partially: {ex}")
+            for e in ex.details['writeErrors']:
+                valid[e['index']].fail(409 if e['code'] == 11000 else 500, ErrorResponseMessage(
+                    error="WRITE_ERROR",
+                    message=f"Document could not be inserted",
+                    detail=e['errmsg']
+                ))
+
+    results = [i.to_result() for i in items]
+    inserted = len([r for r in results if r.error is None])
+    return BulkResult(inserted=inserted, failed=len(results) - inserted, data=results)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger("spartan." + __name__)
+
+# collections whose documents are read by id through the cache
+CACHED_COLLECTIONS = ['ideas', 'files']
+
+
+class DocumentCache:
+    """Bounded LRU cache with a TTL for documents read by their id.
+
+    Cached documents are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # bumped by every invalidation, a read that raced with an invalidation is not cached
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.listening = False
+
+    async def find_one(self, db, collection: str, doc_id) -> dict | None:
+        if self.max_size <= 0:
+            return await db[collection].find_one({'_id': doc_id})
+
+        key = (collection, doc_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        version = self._version
+        doc = await db[collection].find_one({'_id': doc_id})
+        if doc is not None and version == self._version:
+            self._entries[key] = (time.monotonic() + self.ttl, doc)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return doc
+
+    def invalidate(self, collection: str, doc_id):
+        self._version += 1
+        self.invalidations += 1
+        self._entries.pop((collection, doc_id), None)
+
+    def clear(self):
+        self._version += 1
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+async def watch_invalidations(db, cache: DocumentCache, retry_seconds: float = 10.0):
+    """Drops documents changed by other workers (or any other client) from the cache.
+
+    Without a change stream (e.g. standalone server) only the TTL keeps the cache coherent across workers.
+    """
+    pipeline = [
+        {'$match': {'operationType': {'$in': ['update', 'replace', 'delete']},
+                    'ns.coll': {'$in': CACHED_COLLECTIONS}}},
+        {'$project': {'ns.coll': 1, 'documentKey': 1}}
+    ]
+    failed = False
+    while True:
+        try:
+            async with db.watch(pipeline) as stream:
+                # changes may have been missed while the stream was not open
+                cache.clear()
+                cache.listening = True
+                failed = False
+                logger.info(f"listening for changes of {CACHED_COLLECTIONS} to invalidate the cache")
+                async for change in stream:
+                    cache.invalidate(change['ns']['coll'], change['documentKey']['_id'])
+        except PyMongoError as ex:
+            # a standalone server fails on every retry, so this is only logged once
+            log = logger.debug if failed else logger.warning
+            log(f"cache invalidation stream stopped, retry in {retry_seconds}s: {ex}")
+            failed = True
+        cache.listening = False
+        await asyncio.sleep(retry_seconds)
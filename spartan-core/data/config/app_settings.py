@@ -26,4 +26,9 @@ class Settings(BaseSettings):
     spartan_s3_endpoint: str = "localhost:9000"
     spartan_s3_access_key: str = "root"
     spartan_s3_secret_key: str = "secret-key"
-    spartan_s3_secure: bool = False
\ No newline at end of file
+    spartan_s3_secure: bool = False
+    # serialize documents read from mongo without validating them against the response models
+    spartan_trusted_reads: bool = False
+    # cache of documents read by id, a size of 0 disables it
+    spartan_cache_size: int = 10_000
+    spartan_cache_ttl_seconds: float = 30.0
@@ -0,0 +1,103 @@
+import logging
+from collections import Counter
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from .indexes import INDEXES
+
+logger = logging.getLogger("spartan." + __name__)
+
+# context name -> field of the idea document
+CONTEXTS = {
+    'tag': 'tags',
+    'project': 'project',
+    'area': 'area',
+    'resource': 'resource',
+    'archive': 'archive'
+}
+
+# the counts are rebuilt in this collection before it replaces context_counts
+REBUILD_COLLECTION = 'context_counts_rebuild'
+
+
+def context_values(doc: dict | None) -> set[tuple[str, str]]:
+    values = set()
+    if doc is None:
+        return values
+    for context, field in CONTEXTS.items():
+        value = doc.get(field)
+        if value is None:
+            continue
+        if isinstance(value, (list, set)):
+            values.update((context, v) for v in value)
+        else:
+            values.add((context, value))
+    return values
+
+
+async def update_counts(db, changes: list[tuple[dict | None, dict | None]]):
+    """Applies the (before, after) changes of idea documents to the materialized context counts."""
+    delta = Counter()
+    for before, after in changes:
+        old = context_values(before)
+        new = context_values(after)
+        for k in new - old:
+            delta[k] += 1
+        for k in old - new:
+            delta[k] -= 1
+
+    ops = [UpdateOne({'context': context, 'value': value}, {'$inc': {'count': n}}, upsert=True)
+           for (context, value), n in delta.items() if n != 0]
+    if len(ops) == 0:
+        return
+
+    await db['context_counts'].bulk_write(ops, ordered=False)
+    if any(n < 0 for n in delta.values()):
+        await db['context_counts'].delete_many({'count': {'$lte': 0}})
+
+
+async def rebuild_counts(db):
+    """Recomputes all context counts from the ideas collection.
+
+    The counts are built in a separate collection which then replaces the current one, so readers never see a
+    partial rebuild. The increments of update_counts applied to the old counts meanwhile are lost, so the ideas must
+    not be written while the counts are rebuilt.
+    """
+    counts = {}
+    for context, field in CONTEXTS.items():
+        if field == 'tags':
+            pipeline = [{"$unwind": f"${field}"}]
+        else:
+            pipeline = [{"$match": {field: {"$ne": None}}}]
+        pipeline.append({"$group": {"_id": f"${field}", "count": {"$sum": 1}}})
+        async for f in db['ideas'].aggregate(pipeline):
+            counts[(context, f['_id'])] = f['count']
+
+    if len(counts) == 0:
+        await db['context_counts'].delete_many({})
+        logger.info("rebuilt 0 context counts")
+        return
+
+    rebuild = db[REBUILD_COLLECTION]
+    await rebuild.drop()
+    # the renamed collection keeps its indexes
+    await rebuild.create_indexes(INDEXES['context_counts'])
+    await rebuild.insert_many([{'context': context, 'value': value, 'count': n}
+                               for (context, value), n in counts.items()])
+    await rebuild.rename('context_counts', dropTarget=True)
+    logger.info(f"rebuilt {len(counts)} context counts")
+
+
+async def ensure_counts(db):
+    """Builds the context counts once, when they do not exist yet (e.g. after an upgrade)."""
+    try:
+        if await db['context_counts'].find_one({}) is None and await db['ideas'].find_one({}, {'_id': 1}) is not None:
+            await rebuild_counts(db)
+    except PyMongoError as ex:
+        logger.error(f"could not build the context counts: {ex}")
+
+
+async def read_counts(db, context: str) -> list[dict]:
+    found = db['context_counts'].find({'context': context, 'count': {'$gt': 0}}, {'_id': 0, 'value': 1, 'count': 1})
+    return [{'id': f['value'], 'count': f['count']} async for f in found]
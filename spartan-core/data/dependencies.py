@@ -1,7 +1,8 @@
 import logging
 
 from minio import Minio
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from .cache import DocumentCache
 from .config.app_settings import Settings, VALUE_DEFAULT_DB_NAME
 
 logger = logging.getLogger("spartan." + __name__)
@@ -9,11 +10,11 @@ logger = logging.getLogger("spartan." + __name__)
 settings = Settings()
 
 logger.info(f"init mongodb session...")
-mongodb_client = MongoClient(settings.spartan_mongodb_url)
-mongodb_client.admin.command('ping')
-logger.info(f"checking mongodb db...")
+mongodb_client = AsyncIOMotorClient(settings.spartan_mongodb_url)
 mongo_db_session = mongodb_client.get_default_database(VALUE_DEFAULT_DB_NAME)
 
+document_cache = DocumentCache(max_size=settings.spartan_cache_size, ttl=settings.spartan_cache_ttl_seconds)
+
 logger.info(f"init s3 session...")
 s3_session = Minio(
     endpoint=settings.spartan_s3_endpoint,
@@ -28,11 +29,24 @@ if not found:
     s3_session.make_bucket(VALUE_DEFAULT_DB_NAME)
 
 
-def get_mongodb_session():
+async def check_mongodb_session():
+    logger.info(f"checking mongodb db...")
+    await mongodb_client.admin.command('ping')
+
+
+async def get_mongodb_session():
     return mongo_db_session
 
 
-def get_s3_session():
+async def get_trusted_reads() -> bool:
+    return settings.spartan_trusted_reads
+
+
+async def get_document_cache() -> DocumentCache:
+    return document_cache
+
+
+async def get_s3_session():
     return s3_session
 
 
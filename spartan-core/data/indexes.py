@@ -0,0 +1,94 @@
+import logging
+
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger("spartan." + __name__)
+
+
+def _timestamps() -> list[IndexModel]:
+    # list endpoints always sort with _id as tie-breaker (see PaginationParameter.to_sort)
+    return [
+        IndexModel([('created_ts', ASCENDING), ('_id', ASCENDING)]),
+        IndexModel([('modified_ts', ASCENDING), ('_id', ASCENDING)])
+    ]
+
+
+def _parents() -> list[IndexModel]:
+    return [
+        # modified_ts covers the validator lookup of conditional requests (see routers/ideas.py _page_not_modified)
+        IndexModel([('idea_id', ASCENDING), ('_id', ASCENDING), ('modified_ts', ASCENDING)]),
+        IndexModel([('file_id', ASCENDING), ('_id', ASCENDING)])
+    ]
+
+
+INDEXES = {
+    'ideas': [
+        IndexModel([('correlation_id', ASCENDING)], sparse=True),
+        IndexModel([('name', ASCENDING)]),
+        IndexModel([('tags', ASCENDING)]),
+        # also serves the root route which matches ideas without any context
+        IndexModel([('project', ASCENDING), ('area', ASCENDING), ('resource', ASCENDING), ('archive', ASCENDING)]),
+        IndexModel([('area', ASCENDING)]),
+        IndexModel([('resource', ASCENDING)]),
+        IndexModel([('archive', ASCENDING)]),
+        # /ideas/search, a match in the name ranks higher than one in the content
+        IndexModel([('name', TEXT), ('content', TEXT)], weights={'name': 10, 'content': 1}, name='ideas_text'),
+        *_timestamps()
+    ],
+    'labels': [
+        IndexModel([('correlation_id', ASCENDING)], sparse=True),
+        IndexModel([('type', ASCENDING), ('value', ASCENDING)]),
+        *_parents(),
+        *_timestamps()
+    ],
+    'entities': [
+        IndexModel([('correlation_id', ASCENDING)], sparse=True),
+        IndexModel([('type', ASCENDING), ('value', ASCENDING)]),
+        *_parents(),
+        *_timestamps()
+    ],
+    'files': [
+        IndexModel([('correlation_id', ASCENDING)], sparse=True),
+        IndexModel([('idea_id', ASCENDING), ('_id', ASCENDING), ('modified_ts', ASCENDING)]),
+        IndexModel([('hash', ASCENDING)]),
+        IndexModel([('name', ASCENDING)]),
+        *_timestamps()
+    ],
+    'references': [
+        IndexModel([('correlation_id', ASCENDING)], sparse=True),
+        # both are needed so the $or in get_references_from_idea can use an index per branch
+        IndexModel([('source_idea_id', ASCENDING), ('_id', ASCENDING), ('modified_ts', ASCENDING)]),
+        IndexModel([('target_idea_id', ASCENDING), ('_id', ASCENDING), ('modified_ts', ASCENDING)]),
+        IndexModel([('type', ASCENDING)]),
+        *_timestamps()
+    ],
+    'sources': [
+        IndexModel([('correlation_id', ASCENDING)], sparse=True),
+        IndexModel([('idea_id', ASCENDING), ('_id', ASCENDING), ('modified_ts', ASCENDING)]),
+        IndexModel([('url', ASCENDING)]),
+        *_timestamps()
+    ],
+    # pending presigned uploads are dropped once their url has expired
+    'uploads': [
+        IndexModel([('expires_ts', ASCENDING)], expireAfterSeconds=0)
+    ],
+    # materialized counts of the sidebar contexts (see contexts.py)
+    'context_counts': [
+        IndexModel([('context', ASCENDING), ('value', ASCENDING)], unique=True)
+    ]
+}
+
+
+def index_names(collection: str) -> list[str]:
+    return [i.document['name'] for i in INDEXES.get(collection, [])]
+
+
+async def ensure_indexes(db):
+    """Creates the missing indexes of the catalogue, existing indexes are left untouched."""
+    for collection, indexes in INDEXES.items():
+        try:
+            created = await db[collection].create_indexes(indexes)
+            logger.info(f"indexes on '{collection}': {created}")
+        except PyMongoError as ex:
+            logger.error(f"could not create indexes on '{collection}': {ex}")
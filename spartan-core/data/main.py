@@ -1,18 +1,26 @@
+import asyncio
 import logging
 from typing import Annotated
 
 from fastapi import Depends, FastAPI
 from fastapi.responses import ORJSONResponse
 
-from .dependencies import get_mongodb_session
-from .routers import ideas, references, tags, projects, areas, resouces, archives, entities, sources, labels, files
-from .models import convert
-from .models.idea import IdeaList, IdeaRead
-from .models.http import pagination_params, PaginationParameter, SortingParameter, sorting_params
+from .dependencies import get_mongodb_session, check_mongodb_session, mongo_db_session, get_trusted_reads, \
+    document_cache
+from .cache import watch_invalidations
+from .contexts import ensure_counts
+from .indexes import ensure_indexes
+from .routers import ideas, references, tags, projects, areas, resouces, archives, entities, sources, labels, files, \
+    admin
+from .models.error import InvalidParameterError, invalid_parameter_handler
+from .models.idea import IdeaList
+from .models.http import pagination_params, PaginationParameter, SortingParameter, sorting_params, \
+    ProjectionParameter, projection_params, ExpandParameter, expand_params
 
 logger = logging.getLogger("spartan."+__name__)
 
 app = FastAPI(default_response_class=ORJSONResponse)
+app.add_exception_handler(InvalidParameterError, invalid_parameter_handler)
 app.include_router(ideas.router)
 app.include_router(tags.router)
 app.include_router(projects.router)
@@ -24,24 +32,41 @@ app.include_router(sources.router)
 app.include_router(entities.router)
 app.include_router(labels.router)
 app.include_router(files.router)
+app.include_router(admin.router)
+
+
+@app.on_event("startup")
+async def startup():
+    await check_mongodb_session()
+    # index builds can take a while on large collections, so they must not block startup
+    app.state.index_task = asyncio.create_task(_prepare(mongo_db_session))
+    app.state.index_task.add_done_callback(_log_failure)
+    if document_cache.max_size > 0:
+        app.state.cache_task = asyncio.create_task(watch_invalidations(mongo_db_session, document_cache))
+        app.state.cache_task.add_done_callback(_log_failure)
+
+
+def _log_failure(task: asyncio.Task):
+    # the background tasks are never awaited, so their errors would go unnoticed
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"background task failed: {task.exception()!r}", exc_info=task.exception())
+
+
+async def _prepare(db):
+    await ensure_indexes(db)
+    # the unique index on the context counts must exist before they are built
+    await ensure_counts(db)
 
 
 @app.get("/", tags=["root"])
-def get_ideas_without_para(pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                           sorting: Annotated[SortingParameter, Depends(sorting_params)],
-                           db=Depends(get_mongodb_session)) -> IdeaList:
+async def get_ideas_without_para(pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                                 sorting: Annotated[SortingParameter, Depends(sorting_params)],
+                                 projection: Annotated[ProjectionParameter, Depends(projection_params)],
+                                 expand: Annotated[ExpandParameter, Depends(expand_params)],
+                                 db=Depends(get_mongodb_session),
+                                 trusted=Depends(get_trusted_reads)) -> IdeaList:
     query = {"project": {"$eq": None}, "area": {"$eq": None}, "resource": {"$eq": None}, "archive": {"$eq": None}}
 
-    logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}")
-    if sorting.is_set():
-        found = db['ideas'].find(query).sort(*sorting.get_sort_param()).limit(pagination.limit).skip(
-            pagination.offset * pagination.limit)
-    else:
-        found = db['ideas'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
-
-    ideas = []
-    for f in found:
-        ideas.append(IdeaRead(**convert(f)))
-    return IdeaList(data=ideas, query=query,
-                    pagination=pagination.to_dict({'count': len(ideas)}),
-                    sorting=sorting.to_dict())
+    logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}, "
+                 f"projection {projection}, expand {expand}")
+    return await ideas.read_idea_page(db, query, pagination, sorting, projection, expand, trusted)
@@ -0,0 +1,32 @@
+from datetime import datetime
+from typing import Union
+
+from pydantic import BaseModel
+
+
+class IndexUsageRead(BaseModel):
+    name: str
+    ops: int
+    since: Union[datetime, None] = None
+
+
+class IndexReport(BaseModel):
+    collection: str
+    missing: list[str]
+    unused: list[str]
+    unknown: list[str]
+    usage: list[IndexUsageRead]
+
+
+class IndexReportList(BaseModel):
+    data: list[IndexReport]
+
+
+class CacheStats(BaseModel):
+    size: int
+    max_size: int
+    ttl: float
+    hits: int
+    misses: int
+    invalidations: int
+    listening: bool
@@ -0,0 +1,20 @@
+from typing import Union
+
+from pydantic import BaseModel
+
+from .error import ErrorResponseMessage
+
+BULK_MAX_ITEMS = 1000
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: int
+    id: Union[str, None] = None
+    error: Union[ErrorResponseMessage, None] = None
+
+
+class BulkResult(BaseModel):
+    inserted: int
+    failed: int
+    data: list[BulkItemResult]
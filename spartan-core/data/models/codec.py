@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse
+
+
+# values of these exact types are passed through as they are
+_SCALARS = frozenset({str, int, float, bool, datetime, type(None)})
+
+
+def decode_value(value):
+    t = type(value)
+    if t in _SCALARS:
+        return value
+    if t is ObjectId:
+        return str(value)
+    if t is dict:
+        return {k: decode_value(v) for k, v in value.items()}
+    if t is list:
+        return [decode_value(v) for v in value]
+    # subclasses (e.g. SON, Int64) and everything else
+    if isinstance(value, dict):
+        return {k: decode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, set, tuple)):
+        return [decode_value(v) for v in value]
+    if isinstance(value, (str, int, float, datetime)):
+        return value
+    return str(value)
+
+
+def decode(doc: dict) -> dict:
+    """Turns a mongo document into plain python values, '_id' is renamed to 'id'."""
+    data = {}
+    for k, v in doc.items():
+        if k == '_id':
+            k = 'id'
+        t = type(v)
+        if t in _SCALARS:
+            data[k] = v
+        elif t is ObjectId:
+            data[k] = str(v)
+        else:
+            data[k] = decode_value(v)
+    return data
+
+
+def _default(value):
+    # orjson serializes str, int, float, bool, None, datetime, dict and list natively
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    return str(value)
+
+
+def encode(content) -> bytes:
+    """Serializes mongo documents (or structures containing them) to JSON in a single pass."""
+    return orjson.dumps(content, default=_default)
+
+
+def encode_document(doc: dict) -> bytes:
+    if '_id' in doc:
+        doc = {'id' if k == '_id' else k: v for k, v in doc.items()}
+    return encode(doc)
+
+
+def to_document(doc: dict, fields: set[str] | None = None) -> dict:
+    if fields is None:
+        return {'id' if k == '_id' else k: v for k, v in doc.items()}
+    return {'id' if k == '_id' else k: v for k, v in doc.items() if k == '_id' or k in fields}
+
+
+class DocumentResponse(ORJSONResponse):
+    """Serializes trusted mongo documents straight to JSON, without validating them against a response model."""
+
+    def render(self, content) -> bytes:
+        return encode(content)
+
+
+EXPORT_BATCH_SIZE = 1000
+
+
+async def stream_documents(cursor, chunk_size: int = 100):
+    """Yields the documents of a cursor as NDJSON, chunk_size documents per chunk."""
+    chunk = []
+    async for doc in cursor:
+        chunk.append(encode_document(doc))
+        chunk.append(b'\n')
+        if len(chunk) >= 2 * chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+    if len(chunk) > 0:
+        yield b''.join(chunk)
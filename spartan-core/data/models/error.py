@@ -1,4 +1,7 @@
 from typing import Union
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 
@@ -6,3 +9,23 @@ class ErrorResponseMessage(BaseModel):
     error: str
     message: str
     detail: Union[str, None] = None
+
+
+class InvalidParameterError(Exception):
+    """A request parameter which cannot be used, it is answered with status 400 and an ErrorResponseMessage."""
+
+    def __init__(self, message: str, detail: str | None = None):
+        super().__init__(message if detail is None else f"{message}: {detail}")
+        self.message = message
+        self.detail = detail
+
+
+async def invalid_parameter_handler(request: Request, ex: InvalidParameterError) -> JSONResponse:
+    resp = jsonable_encoder(
+        ErrorResponseMessage(
+            error="PARAMETER_ERROR",
+            message=ex.message,
+            detail=ex.detail
+        )
+    )
+    return JSONResponse(content=resp, status_code=400)
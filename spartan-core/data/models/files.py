@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class FiletRead(BaseModel):
@@ -28,3 +28,23 @@ class FileList(BaseModel):
     query: Union[dict, None] = None
     pagination: Union[dict, None] = None
     sorting: Union[dict, None] = None
+
+
+class FileUploadCreate(BaseModel):
+    correlation_id: Union[str, None] = None
+    idea_id: str
+    name: str
+    content_type: str = 'application/octet-stream'
+    size: int = Field(ge=0)
+    hash: str = Field(pattern='^[0-9a-f]{64}$', description='sha256 of the content')
+
+
+class FileUploadRead(BaseModel):
+    id: str
+    url: str
+    expires_ts: datetime
+
+
+class FileDownloadRead(BaseModel):
+    url: str
+    expires_ts: datetime
@@ -1,24 +1,16 @@
+import base64
+import binascii
+import functools
 from datetime import datetime
-from typing import Annotated
+from typing import Annotated, List
 
-from bson import ObjectId
+from bson import ObjectId, json_util
 from bson.errors import InvalidId
 from fastapi import Query
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
 
-
-class PaginationParameter:
-    def __init__(self, offset: int, limit: int):
-        self.offset = offset
-        self.limit = limit
-
-    def to_dict(self, values={}) -> dict:
-        r = {'offset': self.offset, 'limit': self.limit}
-        for k, v in values.items():
-            r[k] = v
-        return r
-
-    def __str__(self):
-        return str(self.to_dict())
+from .error import InvalidParameterError
 
 
 class SortingParameter:
@@ -55,8 +47,230 @@ class SortingParameter:
         return str(self.get_sort_param())
 
 
-def pagination_params(offset: int = 0, limit: int = 100) -> PaginationParameter:
-    return PaginationParameter(offset=offset, limit=limit)
+class PaginationParameter:
+    def __init__(self, offset: int, limit: int, after: str | None = None):
+        self.offset = offset
+        self.limit = limit
+        self.after = after
+        self._cursor = None if after is None else decode_cursor(after)
+
+    def to_query(self, query: dict, sorting: SortingParameter | None = None) -> dict:
+        """Restricts the query to the documents after the 'after' cursor (keyset pagination)."""
+        if self._cursor is None:
+            return query
+
+        key, order = self._sort_key(sorting)
+        cursor_key, value, last_id = self._cursor
+        if cursor_key != key:
+            raise InvalidParameterError("Cursor does not match the sorting",
+                                        f"cursor was created for sort key '{cursor_key}'")
+
+        op = '$gt' if order == 1 else '$lt'
+        if key == '_id':
+            keyset = {'_id': {op: last_id}}
+        elif value is None and order == 1:
+            # null sorts first, so every non-null value comes after it
+            keyset = {'$or': [{key: {'$ne': None}}, {key: None, '_id': {op: last_id}}]}
+        elif value is None:
+            keyset = {key: None, '_id': {op: last_id}}
+        elif order == 1:
+            keyset = {'$or': [{key: {op: value}}, {key: value, '_id': {op: last_id}}]}
+        else:
+            # null sorts last, but is never less than a value
+            keyset = {'$or': [{key: {op: value}}, {key: value, '_id': {op: last_id}}, {key: None}]}
+
+        if len(query) == 0:
+            return keyset
+        return {'$and': [query, keyset]}
+
+    def to_sort(self, sorting: SortingParameter | None = None) -> list:
+        key, order = self._sort_key(sorting)
+        if key == '_id':
+            return [('_id', order)]
+        return [(key, order), ('_id', order)]
+
+    def get_skip(self) -> int:
+        if self._cursor is not None:
+            return 0
+        return self.offset * self.limit
+
+    def next_cursor(self, last: dict | None, count: int, sorting: SortingParameter | None = None) -> str | None:
+        """Cursor of the next page, there is none after a short page."""
+        if last is None or count < self.limit:
+            return None
+        key, _ = self._sort_key(sorting)
+        return encode_cursor(key, last.get(key), last['_id'])
+
+    @classmethod
+    def _sort_key(cls, sorting: SortingParameter | None) -> tuple:
+        if sorting is not None and sorting.is_set():
+            return sorting.get_sort_param()
+        return '_id', 1
+
+    def to_dict(self, values={}) -> dict:
+        r = {'offset': self.offset, 'limit': self.limit, 'after': self.after}
+        for k, v in values.items():
+            r[k] = v
+        return r
+
+    def __str__(self):
+        return str(self.to_dict())
+
+
+class ProjectionParameter:
+    def __init__(self, fields: list[str] | None):
+        self.fields = None
+        if fields is not None:
+            self.fields = {'id'}
+            for f in fields:
+                self.fields.update(k.strip() for k in f.split(',') if k.strip() != '')
+
+    def is_set(self) -> bool:
+        return self.fields is not None
+
+    def to_projection(self, sorting: SortingParameter | None = None) -> dict | None:
+        if not self.is_set():
+            return None
+        projection = {SortingParameter._replace_id(f): 1 for f in self.fields}
+        if sorting is not None and sorting.is_set():
+            # the sort key is needed to build the next cursor
+            projection[sorting.get_sort_param()[0]] = 1
+        return projection
+
+    def to_model(self, model: type[BaseModel], data: dict) -> BaseModel:
+        if not self.is_set():
+            return model(**data)
+        return model.model_construct(**{k: v for k, v in data.items() if k in self.fields})
+
+    def to_response(self, content: BaseModel):
+        """Partial models are not valid response models, so they are serialized without the unset fields."""
+        if not self.is_set():
+            return content
+        return ORJSONResponse(content=content.model_dump(exclude_unset=True))
+
+    def to_dict(self) -> dict:
+        return {'fields': None if self.fields is None else sorted(self.fields)}
+
+    def __str__(self):
+        return str(self.to_dict())
+
+
+# sub-resources inlined per idea, more have to be read from their own endpoint
+EXPAND_MAX_ITEMS = 100
+
+
+def _lookup(collection: str, foreign_field: str, field: str, match: list | None = None) -> dict:
+    """Joins the first EXPAND_MAX_ITEMS sub-resources by id, match can filter them by the idea ($$idea_id)."""
+    return {'$lookup': {'from': collection, 'localField': '_id', 'foreignField': foreign_field,
+                        'let': {'idea_id': '$_id'},
+                        'pipeline': [*(match or []), {'$sort': {'_id': 1}}, {'$limit': EXPAND_MAX_ITEMS}],
+                        'as': field}}
+
+
+@functools.cache
+def _field_adapter(model: type[BaseModel], field: str) -> TypeAdapter:
+    return TypeAdapter(model.model_fields[field].annotation)
+
+
+class ExpandParameter:
+    SUB_RESOURCES = ('references', 'sources', 'entities', 'labels', 'files')
+
+    def __init__(self, expand: list[str] | None):
+        self.fields = None
+        if expand is not None:
+            self.fields = set()
+            for e in expand:
+                self.fields.update(k.strip() for k in e.split(',') if k.strip() != '')
+            unknown = self.fields.difference(self.SUB_RESOURCES)
+            if len(unknown) > 0:
+                raise InvalidParameterError("Sub-resources cannot be expanded",
+                                            f"cannot expand {sorted(unknown)}, "
+                                            f"valid values are {list(self.SUB_RESOURCES)}")
+
+    def is_set(self) -> bool:
+        return self.fields is not None and len(self.fields) > 0
+
+    def to_pipeline(self) -> list:
+        """$lookup stages adding the sub-resources to the ideas of an aggregation."""
+        if not self.is_set():
+            return []
+        stages = []
+        for field in self.SUB_RESOURCES:
+            if field not in self.fields:
+                continue
+            if field == 'references':
+                # references of both directions, a reference of an idea to itself is only taken from the outgoing ones
+                self_reference = [{'$match': {'$expr': {'$ne': ['$source_idea_id', '$$idea_id']}}}]
+                stages += [
+                    _lookup('references', 'source_idea_id', '_outgoing'),
+                    _lookup('references', 'target_idea_id', '_incoming', self_reference),
+                    # both are sorted by id, so the first of the merged ones are the first of all references
+                    {'$addFields': {'references': {'$slice': [
+                        {'$sortArray': {'input': {'$concatArrays': ['$_outgoing', '$_incoming']},
+                                        'sortBy': {'_id': 1}}},
+                        EXPAND_MAX_ITEMS
+                    ]}}},
+                    {'$project': {'_outgoing': 0, '_incoming': 0}}
+                ]
+            else:
+                stages.append(_lookup(field, 'idea_id', field))
+        return stages
+
+    def rename(self, data: dict) -> dict:
+        """Renames '_id' to 'id' in the sub-resources, the idea itself is converted by the caller."""
+        if not self.is_set():
+            return data
+        for field in self.fields:
+            if data.get(field) is not None:
+                data[field] = [{'id' if k == '_id' else k: v for k, v in d.items()} for d in data[field]]
+        return data
+
+    def validate(self, model: type[BaseModel], data: dict) -> dict:
+        """Validates the sub-resources against the fields of the model.
+
+        Partial models are constructed without validation (see ProjectionParameter.to_model), so the sub-resources
+        would be left as dicts.
+        """
+        if not self.is_set():
+            return data
+        for field in self.fields:
+            if data.get(field) is not None:
+                data[field] = _field_adapter(model, field).validate_python(data[field])
+        return data
+
+    def to_response(self, content, field: str | None = None):
+        """The expanded models are not the response models, so they are serialized without the other sub-resources.
+
+        The sub-resources are left out of every item of a list if field names the list.
+        """
+        if not self.is_set() or isinstance(content, Response):
+            return content
+        omitted = {k for k in self.SUB_RESOURCES if k not in self.fields}
+        exclude = omitted if field is None else {field: {'__all__': omitted}}
+        return ORJSONResponse(content=content.model_dump(exclude=exclude))
+
+    def to_dict(self) -> dict:
+        return {'expand': None if self.fields is None else sorted(self.fields)}
+
+    def __str__(self):
+        return str(self.to_dict())
+
+
+def encode_cursor(key: str, value, last_id) -> str:
+    raw = json_util.dumps([key, value, last_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        key, value, last_id = json_util.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return key, value, last_id
+    except (binascii.Error, UnicodeError, ValueError, TypeError) as ex:
+        raise InvalidParameterError("Cursor has not a valid format", f"cursor '{cursor}' is not valid") from ex
+
+
+def pagination_params(offset: int = 0, limit: int = 100, after: str | None = None) -> PaginationParameter:
+    return PaginationParameter(offset=offset, limit=limit, after=after)
 
 
 def sorting_params(sort_by: str | None = None,
@@ -64,6 +278,14 @@ def sorting_params(sort_by: str | None = None,
     return SortingParameter(sort_by=sort_by, sort_order=sort_order)
 
 
+def projection_params(fields: List[str] = Query(None)) -> ProjectionParameter:
+    return ProjectionParameter(fields=fields)
+
+
+def expand_params(expand: List[str] = Query(None)) -> ExpandParameter:
+    return ExpandParameter(expand=expand)
+
+
 def to_query(**kwargs) -> dict:
     query = {}
     for k, v in kwargs.items():
@@ -93,3 +315,43 @@ def to_query(**kwargs) -> dict:
             else:
                 pass
     return query
+
+
+def document_etag(doc: dict) -> str:
+    """Strong etag of a document from its content hash and modification time."""
+    return f'"{doc["hash"]}-{doc["modified_ts"].isoformat(timespec="milliseconds")}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an etag, as required for conditional GETs."""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(t.strip().removeprefix('W/') == etag for t in if_none_match.split(','))
+
+
+def parse_range(range_header: str | None, size: int) -> tuple | None:
+    """Returns the (first, last) byte positions of a single byte range or None if the whole content is sent.
+
+    Multiple ranges and malformed headers are ignored, an unsatisfiable range raises ValueError.
+    """
+    if range_header is None or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    first, sep, last = range_header[len('bytes='):].strip().partition('-')
+    if sep != '-' or (first == '' and last == '') or not (first + last).isdigit():
+        return None
+
+    if first == '':
+        # suffix range, e.g. the last 500 bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError(f"range '{range_header}' is not satisfiable")
+        return max(size - int(last), 0), size - 1
+
+    first = int(first)
+    last = size - 1 if last == '' else min(int(last), size - 1)
+    if first >= size:
+        raise ValueError(f"range '{range_header}' is not satisfiable")
+    if first > last:
+        return None
+    return first, last
@@ -3,6 +3,12 @@ from datetime import datetime
 
 from pydantic import BaseModel
 
+from .entity import EntityRead
+from .files import FiletRead
+from .label import LabelRead
+from .reference import ReferenceRead
+from .source import IdeaSourceRead
+
 
 class IdeaUpdate(BaseModel):
     correlation_id: Union[str, None] = None
@@ -52,3 +58,28 @@ class IdeaList(BaseModel):
     query: Union[dict, None] = None
     pagination: Union[dict, None] = None
     sorting: Union[dict, None] = None
+
+
+class IdeaSearchRead(IdeaRead):
+    score: float
+
+
+class IdeaSearchList(BaseModel):
+    data: list[IdeaSearchRead]
+    query: Union[dict, None] = None
+    pagination: Union[dict, None] = None
+
+
+class IdeaExpandedRead(IdeaRead):
+    references: Union[list[ReferenceRead], None] = None
+    sources: Union[list[IdeaSourceRead], None] = None
+    entities: Union[list[EntityRead], None] = None
+    labels: Union[list[LabelRead], None] = None
+    files: Union[list[FiletRead], None] = None
+
+
+class IdeaExpandedList(BaseModel):
+    data: list[IdeaExpandedRead]
+    query: Union[dict, None] = None
+    pagination: Union[dict, None] = None
+    sorting: Union[dict, None] = None
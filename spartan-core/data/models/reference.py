@@ -34,3 +34,29 @@ class ReferenceList(BaseModel):
     query: Union[dict, None] = None
     pagination: Union[dict, None] = None
     sorting: Union[dict, None] = None
+
+
+# bounds of a graph traversal, the edges are read nearest first until the cap is reached
+GRAPH_MAX_DEPTH = 5
+GRAPH_MAX_EDGES = 1000
+
+
+class GraphDirection(str, Enum):
+    incoming = "in"
+    outgoing = "out"
+    both = "both"
+
+
+class GraphNode(BaseModel):
+    id: str
+    name: Union[str, None] = None
+    depth: int
+
+
+class ReferenceGraph(BaseModel):
+    root: str
+    direction: GraphDirection
+    depth: int
+    truncated: bool
+    nodes: list[GraphNode]
+    edges: list[ReferenceRead]
@@ -0,0 +1,53 @@
+import logging
+
+from fastapi import APIRouter, Depends
+
+from ..contexts import rebuild_counts
+from ..indexes import INDEXES, index_names
+from ..models.admin import CacheStats, IndexReport, IndexReportList, IndexUsageRead
+from ..models.error import ErrorResponseMessage
+from ..dependencies import get_mongodb_session, get_document_cache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    responses={
+        400: {"model": ErrorResponseMessage, "description": "Invalid Input"},
+        404: {"model": ErrorResponseMessage, "description": "Not Found"}
+    }
+)
+
+
+@router.get("/indexes")
+async def read_indexes(db=Depends(get_mongodb_session)) -> IndexReportList:
+    reports = []
+    for collection in INDEXES.keys():
+        expected = index_names(collection)
+        existing = await db[collection].index_information()
+
+        usage = []
+        async for f in db[collection].aggregate([{'$indexStats': {}}]):
+            usage.append(IndexUsageRead(name=f['name'], ops=f['accesses']['ops'], since=f['accesses']['since']))
+
+        reports.append(IndexReport(
+            collection=collection,
+            missing=[name for name in expected if name not in existing],
+            unused=[u.name for u in usage if u.ops == 0 and u.name != '_id_'],
+            unknown=[name for name in existing.keys() if name not in expected and name != '_id_'],
+            usage=usage
+        ))
+    return IndexReportList(data=reports)
+
+
+@router.get("/cache")
+async def read_cache(cache=Depends(get_document_cache)) -> CacheStats:
+    return CacheStats(size=len(cache), max_size=cache.max_size, ttl=cache.ttl, hits=cache.hits, misses=cache.misses,
+                      invalidations=cache.invalidations, listening=cache.listening)
+
+
+@router.post("/contexts/rebuild")
+async def rebuild_contexts(db=Depends(get_mongodb_session)):
+    """Recomputes the sidebar counts. Pause the writes to ideas meanwhile, counts changed during a rebuild are lost."""
+    await rebuild_counts(db)
@@ -4,15 +4,18 @@ from typing import Annotated
 
 from bson import ObjectId
 from bson.errors import InvalidId
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from ..models import convert
+from ..models import convert, timestamp
+from ..models.codec import DocumentResponse, to_document, stream_documents, EXPORT_BATCH_SIZE
+from ..models.bulk import BulkResult, BULK_MAX_ITEMS
 from ..models.error import ErrorResponseMessage
 from ..models.entity import EntityUpdate, EntityRead, EntityList
 from ..models.http import pagination_params, PaginationParameter, sorting_params, SortingParameter, to_query
-from ..dependencies import get_mongodb_session
+from ..bulk import BulkItem, insert_bulk
+from ..dependencies import get_document_cache, get_mongodb_session, get_trusted_reads
 
 logger = logging.getLogger(__name__)
 
@@ -27,10 +30,11 @@ router = APIRouter(
 
 
 @router.post("/")
-def create_entities(entity: EntityUpdate, db=Depends(get_mongodb_session)) -> EntityRead:
+async def create_entities(entity: EntityUpdate, db=Depends(get_mongodb_session),
+                          cache=Depends(get_document_cache)) -> EntityRead:
     try:
         json = jsonable_encoder(entity)
-        now = datetime.now()
+        now = timestamp()
         json['created_ts'] = now
         json['modified_ts'] = now
 
@@ -46,7 +50,7 @@ def create_entities(entity: EntityUpdate, db=Depends(get_mongodb_session)) -> En
 
         if entity.idea_id is not None:
             json['idea_id'] = ObjectId(entity.idea_id)
-            if db['ideas'].find_one({'_id': ObjectId(entity.idea_id)}) is None:
+            if await cache.find_one(db, 'ideas', ObjectId(entity.idea_id)) is None:
                 resp = jsonable_encoder(
                     ErrorResponseMessage(
                         error="ID_ERROR",
@@ -58,7 +62,7 @@ def create_entities(entity: EntityUpdate, db=Depends(get_mongodb_session)) -> En
 
         if entity.file_id is not None:
             json['file_id'] = ObjectId(entity.file_id)
-            if db['files'].find_one({'_id': ObjectId(entity.file_id)}) is None:
+            if await cache.find_one(db, 'files', ObjectId(entity.file_id)) is None:
                 resp = jsonable_encoder(
                     ErrorResponseMessage(
                         error="ID_ERROR",
@@ -68,8 +72,9 @@ def create_entities(entity: EntityUpdate, db=Depends(get_mongodb_session)) -> En
                 )
                 return JSONResponse(content=resp, status_code=404)
 
-        new = db['entities'].insert_one(json)
-        data = convert(db['entities'].find_one({'_id': new.inserted_id}))
+        new = await db['entities'].insert_one(json)
+        json['_id'] = new.inserted_id
+        data = convert(json)
         return EntityRead(**data)
     except InvalidId as ex:
         json = jsonable_encoder(
@@ -82,10 +87,45 @@ def create_entities(entity: EntityUpdate, db=Depends(get_mongodb_session)) -> En
         return JSONResponse(content=json, status_code=400)
 
 
+@router.post("/bulk")
+async def create_entities_bulk(entities: Annotated[list[EntityUpdate], Body(max_length=BULK_MAX_ITEMS)],
+                             db=Depends(get_mongodb_session)) -> BulkResult:
+    now = timestamp()
+    items = []
+    for i, entity in enumerate(entities):
+        item = BulkItem(i)
+        items.append(item)
+        if entity.idea_id is None and entity.file_id is None:
+            item.fail(400, ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"Missing ID",
+                detail=f"Provide 'idea_id' or 'file_id'"
+            ))
+            continue
+        try:
+            json = jsonable_encoder(entity)
+            json['created_ts'] = now
+            json['modified_ts'] = now
+            if entity.idea_id is not None:
+                json['idea_id'] = ObjectId(entity.idea_id)
+                item.add_parent('ideas', 'idea_id', json['idea_id'])
+            if entity.file_id is not None:
+                json['file_id'] = ObjectId(entity.file_id)
+                item.add_parent('files', 'file_id', json['file_id'])
+            item.document = json
+        except InvalidId as ex:
+            item.fail(400, ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"ID has not a valid format",
+                detail=str(ex)
+            ))
+    return await insert_bulk(db, 'entities', items)
+
+
 @router.delete("/{entity_id}")
-def delete_entity(entity_id: str, db=Depends(get_mongodb_session)):
+async def delete_entity(entity_id: str, db=Depends(get_mongodb_session)):
     try:
-        db['entities'].delete_one({'_id': ObjectId(entity_id)})
+        await db['entities'].delete_one({'_id': ObjectId(entity_id)})
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -98,7 +138,7 @@ def delete_entity(entity_id: str, db=Depends(get_mongodb_session)):
 
 
 @router.get("/")
-def get_entities(
+async def get_entities(
         pagination: Annotated[PaginationParameter, Depends(pagination_params)],
         sorting: Annotated[SortingParameter, Depends(sorting_params)],
         correlation_id: str | None = None,
@@ -110,21 +150,49 @@ def get_entities(
         after_created_ts: datetime | None = None,
         before_modified_ts: datetime | None = None,
         after_modified_ts: datetime | None = None,
-        db=Depends(get_mongodb_session)) -> EntityList:
+        db=Depends(get_mongodb_session),
+        trusted=Depends(get_trusted_reads)) -> EntityList:
 
     query = to_query(correlation_id=correlation_id, idea_id=idea_id, file_id=file_id, value=value, type=type,
                      before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
                      before_created_ts=before_created_ts, after_created_ts=after_created_ts)
 
     logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}")
-    if sorting.is_set():
-        found = db['entities'].find(query).sort(*sorting.get_sort_param()).limit(pagination.limit).skip(
-            pagination.offset * pagination.limit)
-    else:
-        found = db['entities'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+    found = db['entities'].find(pagination.to_query(query, sorting)).sort(pagination.to_sort(sorting)).limit(
+        pagination.limit).skip(pagination.get_skip())
     data = []
-    for f in found:
-        data.append(EntityRead(**convert(f)))
-    return EntityList(data=data, query=convert(query),
-                      pagination=pagination.to_dict({'count': len(data)}),
-                      sorting=sorting.to_dict())
+    last = None
+    async for f in found:
+        data.append(to_document(f) if trusted else EntityRead(**convert(f)))
+        last = f
+    content = dict(data=data, query=convert(query),
+                   pagination=pagination.to_dict({'count': len(data),
+                                                   'next_cursor': pagination.next_cursor(last, len(data), sorting)}),
+                   sorting=sorting.to_dict())
+    if trusted:
+        return DocumentResponse(content)
+    return EntityList(**content)
+
+
+@router.get("/export")
+async def export_entities(
+        sorting: Annotated[SortingParameter, Depends(sorting_params)],
+        correlation_id: str | None = None,
+        idea_id: str | None = None,
+        file_id: str | None = None,
+        value: str | None = None,
+        type: str | None = None,
+        before_created_ts: datetime | None = None,
+        after_created_ts: datetime | None = None,
+        before_modified_ts: datetime | None = None,
+        after_modified_ts: datetime | None = None,
+        db=Depends(get_mongodb_session)):
+    query = to_query(correlation_id=correlation_id, idea_id=idea_id, file_id=file_id, value=value, type=type,
+                     before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
+                     before_created_ts=before_created_ts, after_created_ts=after_created_ts)
+
+    logger.debug(f"export query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}")
+    found = db['entities'].find(query, None).batch_size(EXPORT_BATCH_SIZE)
+    if sorting.is_set():
+        found = found.sort(*sorting.get_sort_param())
+    return StreamingResponse(content=stream_documents(found), media_type="application/x-ndjson")
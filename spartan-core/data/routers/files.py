@@ -1,21 +1,25 @@
-import hashlib
 import logging
 from datetime import datetime
 from typing import Annotated, Union, Optional
 
 from bson import ObjectId
 from bson.errors import InvalidId
-from fastapi import APIRouter, Depends, UploadFile, Form, File
+from minio.error import S3Error
+from fastapi import APIRouter, Depends, Request, UploadFile, Form, File
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import Response, StreamingResponse, JSONResponse
 
-from ..models import convert
+from ..models import convert, timestamp
+from ..models.codec import DocumentResponse, to_document
 from ..models.error import ErrorResponseMessage
-from ..models.files import FiletRead, FileUpdate, FileList
+from ..models.files import FiletRead, FileUpdate, FileList, FileUploadCreate, FileUploadRead, FileDownloadRead
 from ..models.entity import EntityRead, EntityList
 from ..models.label import LabelRead, LabelList
-from ..models.http import pagination_params, PaginationParameter, sorting_params, SortingParameter, to_query
-from ..dependencies import get_mongodb_session
+from ..models.http import pagination_params, PaginationParameter, sorting_params, SortingParameter, to_query, \
+    etag_matches, parse_range
+from ..storage import object_name, store_blob, release_file, open_object, stream_object, presign_put, presign_get, \
+    stat_size, copy_object, remove_object, file_object_name, presigned_expiry, STORAGE_ERRORS
+from ..dependencies import get_document_cache, get_mongodb_session, get_trusted_reads, get_s3_session, gte_s3_bucket
 
 logger = logging.getLogger(__name__)
 
@@ -30,13 +34,16 @@ router = APIRouter(
 
 
 @router.post("/")
-def create_file(file: UploadFile,
-                idea_id: Annotated[str, Form()],
-                correlation_id: Union[str, None] = Form(default=None),
-                db=Depends(get_mongodb_session)) -> FiletRead:
+async def create_file(file: UploadFile,
+                      idea_id: Annotated[str, Form()],
+                      correlation_id: Union[str, None] = Form(default=None),
+                      db=Depends(get_mongodb_session),
+                      s3=Depends(get_s3_session),
+                      bucket=Depends(gte_s3_bucket),
+                      cache=Depends(get_document_cache)) -> FiletRead:
     try:
         idea_id = ObjectId(idea_id)
-        if db['ideas'].find_one({'_id': idea_id}) is None:
+        if await cache.find_one(db, 'ideas', idea_id) is None:
             resp = jsonable_encoder(
                 ErrorResponseMessage(
                     error="ID_ERROR",
@@ -46,21 +53,159 @@ def create_file(file: UploadFile,
             )
             return JSONResponse(content=resp, status_code=404)
 
-        contents = file.file.read()
-        file_hash = hashlib.sha256(contents).hexdigest()
-        now = datetime.now()
+        try:
+            reader = await store_blob(db, s3, bucket, file.file, file.content_type)
+        except STORAGE_ERRORS as ex:
+            logger.error(f"could not upload file '{file.filename}': {ex}")
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="STORAGE_ERROR",
+                    message=f"File could not be stored",
+                    detail=ex.message if isinstance(ex, S3Error) else str(ex)
+                )
+            )
+            return JSONResponse(content=resp, status_code=502)
 
+        now = timestamp()
         json = {'idea_id': idea_id, 'name': file.filename, 'content_type': file.content_type,
-                'size': len(contents), 'hash': file_hash, 'hash_type': 'sha256', 'created_ts': now, 'modified_ts': now}
+                'size': reader.size, 'hash': reader.hexdigest(), 'hash_type': reader.hash_type, 'created_ts': now,
+                'modified_ts': now}
 
         if correlation_id is not None:
             json['correlation_id'] = correlation_id
 
-        # TODO: upload to s3
+        try:
+            new = await db['files'].insert_one(json)
+        except Exception:
+            # no file references the blob
+            await release_file(db, s3, bucket, json)
+            raise
+        json['_id'] = new.inserted_id
+        data = convert(json)
+        return FiletRead(**data)
+    except InvalidId as ex:
+        resp = jsonable_encoder(
+            ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"ID has not a valid format",
+                detail=str(ex)
+            )
+        )
+        return JSONResponse(content=resp, status_code=400)
+
 
-        new = db['files'].insert_one(json)
-        data = convert(db['files'].find_one({'_id': new.inserted_id}))
-        return FiletRead(**convert(data))
+@router.post("/uploads")
+async def create_upload(upload: FileUploadCreate, db=Depends(get_mongodb_session), s3=Depends(get_s3_session),
+                        bucket=Depends(gte_s3_bucket), cache=Depends(get_document_cache)) -> FileUploadRead:
+    try:
+        idea_id = ObjectId(upload.idea_id)
+        if await cache.find_one(db, 'ideas', idea_id) is None:
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="ID_ERROR",
+                    message=f"ID does not exist",
+                    detail=f"idea_id '{idea_id}' does not exist"
+                )
+            )
+            return JSONResponse(content=resp, status_code=404)
+
+        # the client uploads the content directly to s3, the file is recorded by finalize_upload
+        upload_id = ObjectId()
+        json = jsonable_encoder(upload)
+        json['_id'] = upload_id
+        json['idea_id'] = idea_id
+        json['object_name'] = f"uploads/{upload_id}"
+        json['created_ts'] = timestamp()
+
+        url = await presign_put(s3, bucket, json['object_name'])
+        # taken after signing, the upload is not dropped before its url has expired
+        json['expires_ts'] = presigned_expiry()
+        await db['uploads'].insert_one(json)
+        return FileUploadRead(id=str(upload_id), url=url, expires_ts=json['expires_ts'])
+    except InvalidId as ex:
+        resp = jsonable_encoder(
+            ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"ID has not a valid format",
+                detail=str(ex)
+            )
+        )
+        return JSONResponse(content=resp, status_code=400)
+
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, db=Depends(get_mongodb_session), s3=Depends(get_s3_session),
+                          bucket=Depends(gte_s3_bucket)) -> FiletRead:
+    try:
+        found = await db['uploads'].find_one({'_id': ObjectId(upload_id)})
+        if found is None:
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="ID_ERROR",
+                    message=f"ID does not exist",
+                    detail=f"upload '{upload_id}' does not exist"
+                )
+            )
+            return JSONResponse(content=resp, status_code=404)
+
+        # the presigned url stays valid after the upload, so the file gets a copy the client cannot overwrite
+        file_id = ObjectId()
+        name = file_object_name(file_id)
+        try:
+            await copy_object(s3, bucket, found['object_name'], name)
+            size = await stat_size(s3, bucket, name)
+        except S3Error as ex:
+            if ex.code != 'NoSuchKey':
+                logger.error(f"could not copy upload '{upload_id}': {ex}")
+                await remove_object(s3, bucket, name)
+                resp = jsonable_encoder(
+                    ErrorResponseMessage(
+                        error="STORAGE_ERROR",
+                        message=f"File could not be read",
+                        detail=ex.message
+                    )
+                )
+                return JSONResponse(content=resp, status_code=502)
+            size = None
+
+        if size != found['size']:
+            if size is not None:
+                await remove_object(s3, bucket, name)
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="UPLOAD_ERROR",
+                    message=f"Content has not been uploaded",
+                    detail=f"expected {found['size']} bytes, found {size}"
+                )
+            )
+            return JSONResponse(content=resp, status_code=409)
+
+        # only one of concurrent finalize calls records the file
+        r = await db['uploads'].delete_one({'_id': found['_id']})
+        if r.deleted_count == 0:
+            await remove_object(s3, bucket, name)
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="ID_ERROR",
+                    message=f"ID does not exist",
+                    detail=f"upload '{upload_id}' does not exist"
+                )
+            )
+            return JSONResponse(content=resp, status_code=404)
+        await remove_object(s3, bucket, found['object_name'])
+
+        now = timestamp()
+        json = {'_id': file_id, 'idea_id': found['idea_id'], 'name': found['name'],
+                'content_type': found['content_type'], 'size': size, 'hash': found['hash'], 'hash_type': 'sha256',
+                'object_name': name, 'created_ts': now, 'modified_ts': now}
+
+        if found['correlation_id'] is not None:
+            json['correlation_id'] = found['correlation_id']
+
+        new = await db['files'].insert_one(json)
+        json['_id'] = new.inserted_id
+        data = convert(json)
+        return FiletRead(**data)
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -73,7 +218,7 @@ def create_file(file: UploadFile,
 
 
 @router.get("/")
-def get_files(
+async def get_files(
         pagination: Annotated[PaginationParameter, Depends(pagination_params)],
         sorting: Annotated[SortingParameter, Depends(sorting_params)],
         correlation_id: str | None = None,
@@ -85,45 +230,84 @@ def get_files(
         after_created_ts: datetime | None = None,
         before_modified_ts: datetime | None = None,
         after_modified_ts: datetime | None = None,
-        db=Depends(get_mongodb_session)) -> FileList:
+        db=Depends(get_mongodb_session),
+        trusted=Depends(get_trusted_reads)) -> FileList:
     query = to_query(correlation_id=correlation_id, idea_id=idea_id, name=name, hash=hash, hash_type=hash_type,
                      before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
                      before_created_ts=before_created_ts, after_created_ts=after_created_ts)
 
     logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}")
-    if sorting.is_set():
-        found = db['files'].find(query).sort(*sorting.get_sort_param()).limit(pagination.limit).skip(
-            pagination.offset * pagination.limit)
-    else:
-        found = db['files'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+    found = db['files'].find(pagination.to_query(query, sorting)).sort(pagination.to_sort(sorting)).limit(
+        pagination.limit).skip(pagination.get_skip())
     ideas = []
-    for f in found:
-        ideas.append(FiletRead(**convert(f)))
-    return FileList(data=ideas, query=convert(query),
-                    pagination=pagination.to_dict({'count': len(ideas)}),
-                    sorting=sorting.to_dict())
-
-
-async def fake_video_streamer():
-    for i in range(10):
-        yield b"some fake video bytes"
+    last = None
+    async for f in found:
+        ideas.append(to_document(f) if trusted else FiletRead(**convert(f)))
+        last = f
+    content = dict(data=ideas, query=convert(query),
+                   pagination=pagination.to_dict({'count': len(ideas),
+                                                   'next_cursor': pagination.next_cursor(last, len(ideas), sorting)}),
+                   sorting=sorting.to_dict())
+    if trusted:
+        return DocumentResponse(content)
+    return FileList(**content)
 
 
 @router.get("/{file_id}/download")
-def download_file(file_id: str, db=Depends(get_mongodb_session)):
+async def download_file(file_id: str, request: Request, db=Depends(get_mongodb_session),
+                        s3=Depends(get_s3_session), bucket=Depends(gte_s3_bucket), cache=Depends(get_document_cache)):
     try:
-        idea_id = ObjectId(file_id)
-        if db['files'].find_one({'_id': idea_id}) is None:
+        found = await cache.find_one(db, 'files', ObjectId(file_id))
+        if found is None:
             resp = jsonable_encoder(
                 ErrorResponseMessage(
                     error="ID_ERROR",
                     message=f"ID does not exist",
-                    detail=f"idea_id '{idea_id}' does not exist"
+                    detail=f"id '{file_id}' does not exist"
                 )
             )
             return JSONResponse(content=resp, status_code=404)
-        # TODO: stream file from s3
-        return StreamingResponse(content=fake_video_streamer(), media_type="text/plain")
+
+        # the content of a file never changes, so its hash is a strong validator
+        etag = f'"{found["hash"]}"'
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes'}
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=headers)
+
+        size = found['size']
+        byte_range = None
+        if request.headers.get('if-range') in (None, etag):
+            try:
+                byte_range = parse_range(request.headers.get('range'), size)
+            except ValueError:
+                headers['Content-Range'] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+
+        if byte_range is None:
+            status_code = 200
+            offset, length = 0, 0
+            headers['Content-Length'] = str(size)
+        else:
+            status_code = 206
+            offset, length = byte_range[0], byte_range[1] - byte_range[0] + 1
+            headers['Content-Length'] = str(length)
+            headers['Content-Range'] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+
+        try:
+            response = await open_object(s3, bucket, object_name(found), offset, length)
+        except S3Error as ex:
+            logger.error(f"could not read file '{file_id}': {ex}")
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="STORAGE_ERROR",
+                    message=f"File could not be read",
+                    detail=ex.message
+                )
+            )
+            return JSONResponse(content=resp, status_code=404 if ex.code == 'NoSuchKey' else 502)
+
+        return StreamingResponse(content=stream_object(response), status_code=status_code,
+                                 media_type=found['content_type'], headers=headers)
     except InvalidId as ex:
         json = jsonable_encoder(
             ErrorResponseMessage(
@@ -135,13 +319,43 @@ def download_file(file_id: str, db=Depends(get_mongodb_session)):
         return JSONResponse(content=json, status_code=400)
 
 
+@router.get("/{file_id}/download-url")
+async def get_download_url(file_id: str, db=Depends(get_mongodb_session), s3=Depends(get_s3_session),
+                           bucket=Depends(gte_s3_bucket), cache=Depends(get_document_cache)) -> FileDownloadRead:
+    try:
+        found = await cache.find_one(db, 'files', ObjectId(file_id))
+        if found is None:
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="ID_ERROR",
+                    message=f"ID does not exist",
+                    detail=f"id '{file_id}' does not exist"
+                )
+            )
+            return JSONResponse(content=resp, status_code=404)
+
+        expires_ts = presigned_expiry()
+        url = await presign_get(s3, bucket, object_name(found), found['content_type'], found['name'])
+        return FileDownloadRead(url=url, expires_ts=expires_ts)
+    except InvalidId as ex:
+        resp = jsonable_encoder(
+            ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"ID has not a valid format",
+                detail=str(ex)
+            )
+        )
+        return JSONResponse(content=resp, status_code=400)
+
+
 @router.delete("/{file_id}")
-def delete_file(file_id: str, db=Depends(get_mongodb_session)):
+async def delete_file(file_id: str, db=Depends(get_mongodb_session), s3=Depends(get_s3_session),
+                      bucket=Depends(gte_s3_bucket), cache=Depends(get_document_cache)):
     try:
-        r = db['files'].delete_one({'_id': ObjectId(file_id)})
-        if r.deleted_count != 0:
-            pass
-            # TODO: delete from s3
+        found = await db['files'].find_one_and_delete({'_id': ObjectId(file_id)})
+        if found is not None:
+            cache.invalidate('files', found['_id'])
+            await release_file(db, s3, bucket, found)
     except InvalidId as ex:
         json = jsonable_encoder(
             ErrorResponseMessage(
@@ -154,17 +368,25 @@ def delete_file(file_id: str, db=Depends(get_mongodb_session)):
 
 
 @router.get("/{file_id}/entities")
-def get_entities_from_file(file_id: str,
-                           pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                           db=Depends(get_mongodb_session)) -> EntityList:
+async def get_entities_from_file(file_id: str,
+                                 pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                                 db=Depends(get_mongodb_session),
+                                 trusted=Depends(get_trusted_reads)) -> EntityList:
     try:
         query = {'file_id': ObjectId(file_id)}
-        found = db['entities'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+        found = db['entities'].find(pagination.to_query(query)).sort(pagination.to_sort()).limit(
+            pagination.limit).skip(pagination.get_skip())
         items = []
-        for f in found:
-            items.append(EntityRead(**convert(f)))
-        return EntityList(data=items, query=convert(query),
-                          pagination=pagination.to_dict({'count': len(items)}))
+        last = None
+        async for f in found:
+            items.append(to_document(f) if trusted else EntityRead(**convert(f)))
+            last = f
+        content = dict(data=items, query=convert(query),
+                       pagination=pagination.to_dict({'count': len(items),
+                                                       'next_cursor': pagination.next_cursor(last, len(items))}))
+        if trusted:
+            return DocumentResponse(content)
+        return EntityList(**content)
     except InvalidId as ex:
         json = jsonable_encoder(
             ErrorResponseMessage(
@@ -177,17 +399,25 @@ def get_entities_from_file(file_id: str,
 
 
 @router.get("/{file_id}/labels")
-def get_labels_from_file(file_id: str,
-                         pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                         db=Depends(get_mongodb_session)) -> LabelList:
+async def get_labels_from_file(file_id: str,
+                               pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                               db=Depends(get_mongodb_session),
+                               trusted=Depends(get_trusted_reads)) -> LabelList:
     try:
         query = {'file_id': ObjectId(file_id)}
-        found = db['labels'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+        found = db['labels'].find(pagination.to_query(query)).sort(pagination.to_sort()).limit(
+            pagination.limit).skip(pagination.get_skip())
         items = []
-        for f in found:
-            items.append(LabelRead(**convert(f)))
-        return LabelList(data=items, query=convert(query),
-                         pagination=pagination.to_dict({'count': len(items)}))
+        last = None
+        async for f in found:
+            items.append(to_document(f) if trusted else LabelRead(**convert(f)))
+            last = f
+        content = dict(data=items, query=convert(query),
+                       pagination=pagination.to_dict({'count': len(items),
+                                                       'next_cursor': pagination.next_cursor(last, len(items))}))
+        if trusted:
+            return DocumentResponse(content)
+        return LabelList(**content)
     except InvalidId as ex:
         json = jsonable_encoder(
             ErrorResponseMessage(
@@ -5,20 +5,28 @@ from typing import Annotated, List
 
 from bson import ObjectId
 from bson.errors import InvalidId
-from fastapi import APIRouter, Depends, Query
+from pymongo import ReturnDocument
+from fastapi import APIRouter, Body, Depends, Query, Request
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
-
-from ..models import convert
-from ..models.error import ErrorResponseMessage
-from ..models.idea import IdeaList, IdeaRead, IdeaUpdate, IdeaPatch
-from ..models.reference import ReferenceRead, ReferenceList
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from ..models import convert, timestamp
+from ..models.codec import DocumentResponse, to_document, stream_documents, EXPORT_BATCH_SIZE
+from ..models.bulk import BulkResult, BULK_MAX_ITEMS
+from ..models.error import ErrorResponseMessage, InvalidParameterError
+from ..models.idea import IdeaList, IdeaRead, IdeaUpdate, IdeaPatch, IdeaSearchList, IdeaSearchRead, \
+    IdeaExpandedList, IdeaExpandedRead
+from ..models.reference import ReferenceRead, ReferenceList, ReferenceGraph, GraphDirection, GRAPH_MAX_DEPTH, \
+    GRAPH_MAX_EDGES
 from ..models.source import IdeaSourceRead, IdeaSourceList
 from ..models.entity import EntityRead, EntityList
 from ..models.label import LabelRead, LabelList
 from ..models.files import FiletRead, FileList
-from ..models.http import pagination_params, PaginationParameter, sorting_params, SortingParameter, to_query
-from ..dependencies import get_mongodb_session
+from ..models.http import pagination_params, PaginationParameter, sorting_params, SortingParameter, to_query, \
+    ProjectionParameter, projection_params, ExpandParameter, expand_params, document_etag, etag_matches
+from ..bulk import BulkItem, insert_bulk
+from ..contexts import update_counts
+from ..dependencies import get_document_cache, get_mongodb_session, get_trusted_reads
 
 logger = logging.getLogger(__name__)
 
@@ -33,9 +41,11 @@ router = APIRouter(
 
 
 @router.get("/")
-def read_ideas(
+async def read_ideas(
         pagination: Annotated[PaginationParameter, Depends(pagination_params)],
         sorting: Annotated[SortingParameter, Depends(sorting_params)],
+        projection: Annotated[ProjectionParameter, Depends(projection_params)],
+        expand: Annotated[ExpandParameter, Depends(expand_params)],
         correlation_id: str | None = None,
         name: str | None = None,
         tags: List[str] = Query(None),
@@ -47,30 +57,147 @@ def read_ideas(
         after_created_ts: datetime | None = None,
         before_modified_ts: datetime | None = None,
         after_modified_ts: datetime | None = None,
-        db=Depends(get_mongodb_session)
+        db=Depends(get_mongodb_session),
+        trusted=Depends(get_trusted_reads)
 ) -> IdeaList:
     query = to_query(correlation_id=correlation_id, name=name, tags=tags, project=project, area=area, resource=resource, archive=archive,
                      before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
                      before_created_ts=before_created_ts, after_created_ts=after_created_ts)
 
-    logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}")
-    if sorting.is_set():
-        found = db['ideas'].find(query).sort(*sorting.get_sort_param()).limit(pagination.limit).skip(
-            pagination.offset * pagination.limit)
+    logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}, "
+                 f"projection {projection}, expand {expand}")
+    return await read_idea_page(db, query, pagination, sorting, projection, expand, trusted)
+
+
+async def read_idea_page(db, query: dict, pagination: PaginationParameter, sorting: SortingParameter,
+                         projection: ProjectionParameter, expand: ExpandParameter, trusted: bool):
+    """A page of the ideas matching the query as returned by all idea lists, with the sub-resources to expand."""
+    if expand.is_set():
+        if projection.is_set():
+            projection.fields.update(expand.fields)
+        # the same page as the find below, the sub-resources are joined to it in the same round trip
+        pipeline = [{'$match': pagination.to_query(query, sorting)}, {'$sort': dict(pagination.to_sort(sorting))},
+                    {'$skip': pagination.get_skip()}, {'$limit': pagination.limit}]
+        if projection.is_set():
+            pipeline.append({'$project': projection.to_projection(sorting)})
+        found = db['ideas'].aggregate(pipeline + expand.to_pipeline())
     else:
-        found = db['ideas'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+        found = db['ideas'].find(pagination.to_query(query, sorting), projection.to_projection(sorting)).sort(
+            pagination.to_sort(sorting)).limit(pagination.limit).skip(pagination.get_skip())
+    model = IdeaExpandedRead if expand.is_set() else IdeaRead
+    data = []
+    last = None
+    async for f in found:
+        if trusted:
+            data.append(expand.rename(to_document(f, projection.fields)))
+        elif projection.is_set():
+            # partial models are not validated, but their sub-resources must be models too
+            data.append(projection.to_model(model, expand.validate(model, expand.rename(convert(f)))))
+        else:
+            data.append(model(**expand.rename(convert(f))))
+        last = f
+    content = dict(data=data, query=query,
+                   pagination=pagination.to_dict({'count': len(data),
+                                                   'next_cursor': pagination.next_cursor(last, len(data), sorting)}),
+                   sorting=sorting.to_dict())
+    if trusted:
+        return DocumentResponse(content)
+    if expand.is_set():
+        return expand.to_response(projection.to_response(IdeaExpandedList(**content)), 'data')
+    return projection.to_response(IdeaList(**content))
+
+
+@router.get("/export")
+async def export_ideas(
+        sorting: Annotated[SortingParameter, Depends(sorting_params)],
+        projection: Annotated[ProjectionParameter, Depends(projection_params)],
+        correlation_id: str | None = None,
+        name: str | None = None,
+        tags: List[str] = Query(None),
+        project: str | None = None,
+        area: str | None = None,
+        resource: str | None = None,
+        archive: str | None = None,
+        before_created_ts: datetime | None = None,
+        after_created_ts: datetime | None = None,
+        before_modified_ts: datetime | None = None,
+        after_modified_ts: datetime | None = None,
+        db=Depends(get_mongodb_session)):
+    query = to_query(correlation_id=correlation_id, name=name, tags=tags, project=project, area=area, resource=resource,
+                     archive=archive, before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
+                     before_created_ts=before_created_ts, after_created_ts=after_created_ts)
+
+    logger.debug(f"export query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}")
+    found = db['ideas'].find(query, projection.to_projection()).batch_size(EXPORT_BATCH_SIZE)
+    if sorting.is_set():
+        found = found.sort(*sorting.get_sort_param())
+    return StreamingResponse(content=stream_documents(found), media_type="application/x-ndjson")
+
+
+@router.get("/search")
+async def search_ideas(
+        q: Annotated[str, Query(min_length=1)],
+        pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+        projection: Annotated[ProjectionParameter, Depends(projection_params)],
+        correlation_id: str | None = None,
+        tags: List[str] = Query(None),
+        project: str | None = None,
+        area: str | None = None,
+        resource: str | None = None,
+        archive: str | None = None,
+        before_created_ts: datetime | None = None,
+        after_created_ts: datetime | None = None,
+        before_modified_ts: datetime | None = None,
+        after_modified_ts: datetime | None = None,
+        db=Depends(get_mongodb_session),
+        trusted=Depends(get_trusted_reads)
+) -> IdeaSearchList:
+    if pagination.after is not None:
+        # the relevance is not a field of the documents, so there is no keyset to continue from
+        raise InvalidParameterError("Search results cannot be paged with a cursor",
+                                    "search results are ranked by relevance, use offset instead of after")
+
+    query = to_query(correlation_id=correlation_id, tags=tags, project=project, area=area, resource=resource,
+                     archive=archive, before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
+                     before_created_ts=before_created_ts, after_created_ts=after_created_ts)
+    query['$text'] = {'$search': q}
+
+    if projection.is_set():
+        projection.fields.add('score')
+    fields = projection.to_projection() or {}
+    fields['score'] = {'$meta': 'textScore'}
+
+    logger.debug(f"search query: {query}, pagination {pagination}, projection {projection}")
+    found = db['ideas'].find(query, fields).sort([('score', {'$meta': 'textScore'}), ('_id', 1)]).limit(
+        pagination.limit).skip(pagination.get_skip())
     data = []
-    for f in found:
-        data.append(IdeaRead(**convert(f)))
-    return IdeaList(data=data, query=query,
-                    pagination=pagination.to_dict({'count': len(data)}),
-                    sorting=sorting.to_dict())
+    async for f in found:
+        data.append(to_document(f, projection.fields) if trusted else projection.to_model(IdeaSearchRead, convert(f)))
+    content = dict(data=data, query=query, pagination=pagination.to_dict({'count': len(data)}))
+    if trusted:
+        return DocumentResponse(content)
+    return projection.to_response(IdeaSearchList(**content))
 
 
 @router.get("/{idea_id}")
-def read_idea(idea_id: str, db=Depends(get_mongodb_session)) -> IdeaRead:
+async def read_idea(idea_id: str, request: Request, response: Response,
+                    expand: Annotated[ExpandParameter, Depends(expand_params)], db=Depends(get_mongodb_session),
+                    trusted=Depends(get_trusted_reads), cache=Depends(get_document_cache)) -> IdeaRead:
     try:
-        found = db['ideas'].find_one({'_id': ObjectId(idea_id)})
+        if_none_match = request.headers.get('if-none-match')
+        if expand.is_set():
+            found = await db['ideas'].aggregate([{'$match': {'_id': ObjectId(idea_id)}}, *expand.to_pipeline()]) \
+                .to_list(1)
+            found = found[0] if len(found) > 0 else None
+        elif if_none_match is None:
+            found = await cache.find_one(db, 'ideas', ObjectId(idea_id))
+        else:
+            # only the validator fields are read to answer a conditional request
+            current = await db['ideas'].find_one({'_id': ObjectId(idea_id)}, {'hash': 1, 'modified_ts': 1})
+            if current is not None and etag_matches(if_none_match, document_etag(current)):
+                return Response(status_code=304, headers={'ETag': document_etag(current)})
+            # the client has an outdated copy, the cache might have one as well
+            found = None if current is None else await db['ideas'].find_one({'_id': ObjectId(idea_id)})
         if found is None:
             resp = jsonable_encoder(
                 ErrorResponseMessage(
@@ -80,6 +207,14 @@ def read_idea(idea_id: str, db=Depends(get_mongodb_session)) -> IdeaRead:
                 )
             )
             return JSONResponse(content=resp, status_code=404)
+        if expand.is_set():
+            # the etag of the idea does not cover its sub-resources
+            if trusted:
+                return DocumentResponse(expand.rename(to_document(found)))
+            return expand.to_response(IdeaExpandedRead(**expand.rename(convert(found))))
+        if trusted:
+            return DocumentResponse(to_document(found), headers={'ETag': document_etag(found)})
+        response.headers['ETag'] = document_etag(found)
         data = convert(found)
         return IdeaRead(**data)
     except InvalidId as ex:
@@ -94,11 +229,12 @@ def read_idea(idea_id: str, db=Depends(get_mongodb_session)) -> IdeaRead:
 
 
 @router.delete("/{idea_id}")
-def delete_idea(idea_id: str, db=Depends(get_mongodb_session)):
+async def delete_idea(idea_id: str, db=Depends(get_mongodb_session), cache=Depends(get_document_cache)):
     try:
-        r = db['ideas'].delete_one({'_id': ObjectId(idea_id)})
-        if r.deleted_count != 0:
-            pass
+        found = await db['ideas'].find_one_and_delete({'_id': ObjectId(idea_id)})
+        if found is not None:
+            cache.invalidate('ideas', found['_id'])
+            await update_counts(db, [(found, None)])
 
     except InvalidId as ex:
         resp = jsonable_encoder(
@@ -112,10 +248,21 @@ def delete_idea(idea_id: str, db=Depends(get_mongodb_session)):
 
 
 @router.put("/{idea_id}")
-def update_idea(idea_id: str, idea: IdeaUpdate, db=Depends(get_mongodb_session)) -> IdeaRead:
+async def update_idea(idea_id: str, idea: IdeaUpdate, response: Response, db=Depends(get_mongodb_session),
+                      cache=Depends(get_document_cache)) -> IdeaRead:
     try:
-        found = db['ideas'].find_one({'_id': ObjectId(idea_id)})
-        if found is None:
+        m = hashlib.sha256()
+        m.update(idea.content.encode('utf-8'))
+        json = jsonable_encoder(idea)
+        json['size'] = len(idea.content)
+        json['hash'] = m.hexdigest()
+        json['hash_type'] = 'sha256'
+        json['modified_ts'] = timestamp()
+
+        # the document before the update is needed to adjust the context counts
+        before = await db['ideas'].find_one_and_update({'_id': ObjectId(idea_id)}, {"$set": json},
+                                                       return_document=ReturnDocument.BEFORE)
+        if before is None:
             resp = jsonable_encoder(
                 ErrorResponseMessage(
                     error="ID_ERROR",
@@ -124,17 +271,11 @@ def update_idea(idea_id: str, idea: IdeaUpdate, db=Depends(get_mongodb_session))
                 )
             )
             return JSONResponse(content=resp, status_code=404)
-
-        m = hashlib.sha256()
-        json = jsonable_encoder(idea)
-        json['size'] = len(idea.content)
-        json['hash'] = m.hexdigest()
-        json['hash_type'] = 'sha256'
-        json['modified_ts'] = datetime.now()
-
-        db['ideas'].update_one({'_id': ObjectId(idea_id)}, {"$set": json})
-        data = convert(db['ideas'].find_one({'_id': ObjectId(idea_id)}))
-        return IdeaRead(**data)
+        cache.invalidate('ideas', before['_id'])
+        found = {**before, **json}
+        await update_counts(db, [(before, found)])
+        response.headers['ETag'] = document_etag(found)
+        return IdeaRead(**convert(found))
 
     except InvalidId as ex:
         resp = jsonable_encoder(
@@ -148,23 +289,14 @@ def update_idea(idea_id: str, idea: IdeaUpdate, db=Depends(get_mongodb_session))
 
 
 @router.patch("/{idea_id}")
-def patch_idea(idea_id: str, idea: IdeaPatch, db=Depends(get_mongodb_session)) -> IdeaRead:
+async def patch_idea(idea_id: str, idea: IdeaPatch, response: Response, db=Depends(get_mongodb_session),
+                     cache=Depends(get_document_cache)) -> IdeaRead:
     try:
-        found = db['ideas'].find_one({'_id': ObjectId(idea_id)})
-        if found is None:
-            resp = jsonable_encoder(
-                ErrorResponseMessage(
-                    error="ID_ERROR",
-                    message=f"ID does not exist",
-                    detail=f"id '{idea_id}' does not exist"
-                )
-            )
-            return JSONResponse(content=resp, status_code=404)
-
         update_data = idea.model_dump(exclude_unset=True)
 
         if 'content' in update_data:
             m = hashlib.sha256()
+            m.update(idea.content.encode('utf-8'))
             update_data['size'] = len(idea.content)
             update_data['hash'] = m.hexdigest()
             update_data['hash_type'] = 'sha256'
@@ -176,11 +308,28 @@ def patch_idea(idea_id: str, idea: IdeaPatch, db=Depends(get_mongodb_session)) -
                 update_data['tags'] = None
 
         if len(update_data.keys()) > 0:
-            update_data['modified_ts'] = datetime.now()
-            db['ideas'].update_one({'_id': ObjectId(idea_id)}, {"$set": update_data})
+            update_data['modified_ts'] = timestamp()
+            before = await db['ideas'].find_one_and_update({'_id': ObjectId(idea_id)}, {"$set": update_data},
+                                                           return_document=ReturnDocument.BEFORE)
+            found = None
+            if before is not None:
+                cache.invalidate('ideas', before['_id'])
+                found = {**before, **update_data}
+                await update_counts(db, [(before, found)])
+        else:
+            found = await db['ideas'].find_one({'_id': ObjectId(idea_id)})
 
-        data = convert(db['ideas'].find_one({'_id': ObjectId(idea_id)}))
-        return IdeaRead(**data)
+        if found is None:
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="ID_ERROR",
+                    message=f"ID does not exist",
+                    detail=f"id '{idea_id}' does not exist"
+                )
+            )
+            return JSONResponse(content=resp, status_code=404)
+        response.headers['ETag'] = document_etag(found)
+        return IdeaRead(**convert(found))
 
     except InvalidId as ex:
         resp = jsonable_encoder(
@@ -193,36 +342,177 @@ def patch_idea(idea_id: str, idea: IdeaPatch, db=Depends(get_mongodb_session)) -
         return JSONResponse(content=resp, status_code=400)
 
 
-@router.post("/")
-def create_idea(idea: IdeaUpdate, db=Depends(get_mongodb_session)) -> IdeaRead:
+def _new_idea(idea: IdeaUpdate, now: datetime) -> dict:
     json = jsonable_encoder(idea)
     json['size'] = len(idea.content)
 
-    now = datetime.now()
     m = hashlib.sha256()
     m.update(idea.content.encode('utf-8'))
     json['hash'] = m.hexdigest()
     json['hash_type'] = 'sha256'
     json['created_ts'] = now
     json['modified_ts'] = now
+    return json
+
 
-    new = db['ideas'].insert_one(json)
-    data = convert(db['ideas'].find_one({'_id': new.inserted_id}))
+@router.post("/")
+async def create_idea(idea: IdeaUpdate, response: Response, db=Depends(get_mongodb_session)) -> IdeaRead:
+    json = _new_idea(idea, timestamp())
+    new = await db['ideas'].insert_one(json)
+    json['_id'] = new.inserted_id
+    await update_counts(db, [(None, json)])
+    response.headers['ETag'] = document_etag(json)
+    data = convert(json)
     return IdeaRead(**data)
 
 
+@router.post("/bulk")
+async def create_ideas_bulk(ideas: Annotated[list[IdeaUpdate], Body(max_length=BULK_MAX_ITEMS)],
+                            db=Depends(get_mongodb_session)) -> BulkResult:
+    now = timestamp()
+    items = []
+    for i, idea in enumerate(ideas):
+        item = BulkItem(i)
+        item.document = _new_idea(idea, now)
+        items.append(item)
+    result = await insert_bulk(db, 'ideas', items)
+    await update_counts(db, [(None, i.document) for i in items if i.is_valid()])
+    return result
+
+
+def _find_page(db, collection: str, query: dict, pagination: PaginationParameter, projection: dict | None = None):
+    return db[collection].find(pagination.to_query(query), projection).sort(pagination.to_sort()).limit(
+        pagination.limit).skip(pagination.get_skip())
+
+
+def _page_etag(versions: list, request: Request) -> str:
+    """Etag of a sub-resource page from the (_id, modified_ts) of its documents and the query string selecting it."""
+    m = hashlib.sha256(request.url.query.encode('utf-8'))
+    for doc_id, modified_ts in versions:
+        m.update(f"|{doc_id}:{modified_ts}".encode('utf-8'))
+    return f'"{m.hexdigest()[:32]}"'
+
+
+async def _page_not_modified(db, collection: str, query: dict, pagination: PaginationParameter,
+                             request: Request) -> Response | None:
+    """Answers a conditional request for a page with 304, the validators are read from the index only."""
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is None:
+        return None
+    found = _find_page(db, collection, query, pagination, {'_id': 1, 'modified_ts': 1})
+    etag = _page_etag([(f['_id'], f.get('modified_ts')) async for f in found], request)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    return None
+
+
 @router.get("/{idea_id}/references")
-def get_references_from_idea(idea_id: str,
-                             pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                             db=Depends(get_mongodb_session)) -> ReferenceList:
+async def get_references_from_idea(idea_id: str,
+                                   pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                                   request: Request,
+                                   response: Response,
+                                   db=Depends(get_mongodb_session),
+                                   trusted=Depends(get_trusted_reads)) -> ReferenceList:
     try:
         query = {'$or': [{'target_idea_id': ObjectId(idea_id)}, {'source_idea_id': ObjectId(idea_id)}]}
-        found = db['references'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+        not_modified = await _page_not_modified(db, 'references', query, pagination, request)
+        if not_modified is not None:
+            return not_modified
+        found = _find_page(db, 'references', query, pagination)
         data = []
-        for f in found:
-            data.append(ReferenceRead(**convert(f)))
-        return ReferenceList(data=data, query=convert(query),
-                             pagination=pagination.to_dict({'count': len(data)}))
+        versions = []
+        last = None
+        async for f in found:
+            versions.append((f['_id'], f.get('modified_ts')))
+            data.append(to_document(f) if trusted else ReferenceRead(**convert(f)))
+            last = f
+        content = dict(data=data, query=convert(query),
+                       pagination=pagination.to_dict({'count': len(data),
+                                                       'next_cursor': pagination.next_cursor(last, len(data))}))
+        etag = _page_etag(versions, request)
+        if trusted:
+            return DocumentResponse(content, headers={'ETag': etag})
+        response.headers['ETag'] = etag
+        return ReferenceList(**content)
+    except InvalidId as ex:
+        resp = jsonable_encoder(
+            ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"ID has not a valid format",
+                detail=str(ex)
+            )
+        )
+        return JSONResponse(content=resp, status_code=400)
+
+
+async def _walk_references(db, root_id, depth: int, direction: GraphDirection) -> tuple[list, dict, bool]:
+    """Breadth first walk over the references, nearest first and by id within a hop.
+
+    Every hop is one query over the indexed idea ids of the frontier, limited to the edges left of GRAPH_MAX_EDGES,
+    so a dense neighbourhood never reads more than the cap. Returns the edges, the hops of the ideas from the root
+    and whether the cap was hit.
+    """
+    ends = []
+    if direction in (GraphDirection.outgoing, GraphDirection.both):
+        ends.append(('source_idea_id', 'target_idea_id'))
+    if direction in (GraphDirection.incoming, GraphDirection.both):
+        ends.append(('target_idea_id', 'source_idea_id'))
+
+    edges = {}
+    depths = {root_id: 0}
+    frontier = [root_id]
+    for hop in range(depth):
+        budget = GRAPH_MAX_EDGES - len(edges)
+        # with both directions the edges back to the previous hop are found again
+        query = {'$or': [{near: {'$in': frontier}} for near, _ in ends], '_id': {'$nin': list(edges.keys())}}
+        found = await db['references'].find(query).sort('_id', 1).limit(budget + 1).to_list(None)
+        frontier = []
+        for edge in found[:budget]:
+            edges[edge['_id']] = edge
+            for _, far in ends:
+                node_id = edge.get(far)
+                if node_id is not None and node_id not in depths:
+                    depths[node_id] = hop + 1
+                    frontier.append(node_id)
+        if len(found) > budget:
+            return list(edges.values()), depths, True
+        if len(frontier) == 0:
+            break
+    return list(edges.values()), depths, False
+
+
+@router.get("/{idea_id}/graph")
+async def get_graph_from_idea(idea_id: str,
+                              depth: Annotated[int, Query(ge=1, le=GRAPH_MAX_DEPTH)] = 1,
+                              direction: GraphDirection = GraphDirection.both,
+                              db=Depends(get_mongodb_session),
+                              cache=Depends(get_document_cache),
+                              trusted=Depends(get_trusted_reads)) -> ReferenceGraph:
+    try:
+        root = await cache.find_one(db, 'ideas', ObjectId(idea_id))
+        if root is None:
+            resp = jsonable_encoder(
+                ErrorResponseMessage(
+                    error="ID_ERROR",
+                    message=f"ID does not exist",
+                    detail=f"id '{idea_id}' does not exist"
+                )
+            )
+            return JSONResponse(content=resp, status_code=404)
+
+        edges, depths, truncated = await _walk_references(db, root['_id'], depth, direction)
+
+        names = {root['_id']: root.get('name')}
+        async for f in db['ideas'].find({'_id': {'$in': [k for k in depths if k != root['_id']]}}, {'name': 1}):
+            names[f['_id']] = f.get('name')
+        # references can point to ideas which were deleted since
+        nodes = [{'id': str(k), 'name': names[k], 'depth': v} for k, v in depths.items() if k in names]
+
+        content = dict(root=str(root['_id']), direction=direction.value, depth=depth, truncated=truncated,
+                       nodes=nodes, edges=[to_document(e) if trusted else ReferenceRead(**convert(e)) for e in edges])
+        if trusted:
+            return DocumentResponse(content)
+        return ReferenceGraph(**content)
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -235,17 +525,33 @@ def get_references_from_idea(idea_id: str,
 
 
 @router.get("/{idea_id}/sources")
-def get_sources_from_idea(idea_id: str,
-                          pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                          db=Depends(get_mongodb_session)) -> IdeaSourceList:
+async def get_sources_from_idea(idea_id: str,
+                                pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                                request: Request,
+                                response: Response,
+                                db=Depends(get_mongodb_session),
+                                trusted=Depends(get_trusted_reads)) -> IdeaSourceList:
     try:
         query = {'idea_id': ObjectId(idea_id)}
-        found = db['sources'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+        not_modified = await _page_not_modified(db, 'sources', query, pagination, request)
+        if not_modified is not None:
+            return not_modified
+        found = _find_page(db, 'sources', query, pagination)
         data = []
-        for f in found:
-            data.append(IdeaSourceRead(**convert(f)))
-        return IdeaSourceList(data=data, query=convert(query),
-                              pagination=pagination.to_dict({'count': len(data)}))
+        versions = []
+        last = None
+        async for f in found:
+            versions.append((f['_id'], f.get('modified_ts')))
+            data.append(to_document(f) if trusted else IdeaSourceRead(**convert(f)))
+            last = f
+        content = dict(data=data, query=convert(query),
+                       pagination=pagination.to_dict({'count': len(data),
+                                                       'next_cursor': pagination.next_cursor(last, len(data))}))
+        etag = _page_etag(versions, request)
+        if trusted:
+            return DocumentResponse(content, headers={'ETag': etag})
+        response.headers['ETag'] = etag
+        return IdeaSourceList(**content)
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -258,17 +564,33 @@ def get_sources_from_idea(idea_id: str,
 
 
 @router.get("/{idea_id}/entities")
-def get_entities_from_idea(idea_id: str,
-                           pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                           db=Depends(get_mongodb_session)) -> EntityList:
+async def get_entities_from_idea(idea_id: str,
+                                 pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                                 request: Request,
+                                 response: Response,
+                                 db=Depends(get_mongodb_session),
+                                 trusted=Depends(get_trusted_reads)) -> EntityList:
     try:
         query = {'idea_id': ObjectId(idea_id)}
-        found = db['entities'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+        not_modified = await _page_not_modified(db, 'entities', query, pagination, request)
+        if not_modified is not None:
+            return not_modified
+        found = _find_page(db, 'entities', query, pagination)
         data = []
-        for f in found:
-            data.append(EntityRead(**convert(f)))
-        return EntityList(data=data, query=convert(query),
-                          pagination=pagination.to_dict({'count': len(data)}))
+        versions = []
+        last = None
+        async for f in found:
+            versions.append((f['_id'], f.get('modified_ts')))
+            data.append(to_document(f) if trusted else EntityRead(**convert(f)))
+            last = f
+        content = dict(data=data, query=convert(query),
+                       pagination=pagination.to_dict({'count': len(data),
+                                                       'next_cursor': pagination.next_cursor(last, len(data))}))
+        etag = _page_etag(versions, request)
+        if trusted:
+            return DocumentResponse(content, headers={'ETag': etag})
+        response.headers['ETag'] = etag
+        return EntityList(**content)
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -281,17 +603,33 @@ def get_entities_from_idea(idea_id: str,
 
 
 @router.get("/{idea_id}/labels")
-def get_labels_from_idea(idea_id: str,
-                         pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                         db=Depends(get_mongodb_session)) -> LabelList:
+async def get_labels_from_idea(idea_id: str,
+                               pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                               request: Request,
+                               response: Response,
+                               db=Depends(get_mongodb_session),
+                               trusted=Depends(get_trusted_reads)) -> LabelList:
     try:
         query = {'idea_id': ObjectId(idea_id)}
-        found = db['labels'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+        not_modified = await _page_not_modified(db, 'labels', query, pagination, request)
+        if not_modified is not None:
+            return not_modified
+        found = _find_page(db, 'labels', query, pagination)
         data = []
-        for f in found:
-            data.append(LabelRead(**convert(f)))
-        return LabelList(data=data, query=convert(query),
-                         pagination=pagination.to_dict({'count': len(data)}))
+        versions = []
+        last = None
+        async for f in found:
+            versions.append((f['_id'], f.get('modified_ts')))
+            data.append(to_document(f) if trusted else LabelRead(**convert(f)))
+            last = f
+        content = dict(data=data, query=convert(query),
+                       pagination=pagination.to_dict({'count': len(data),
+                                                       'next_cursor': pagination.next_cursor(last, len(data))}))
+        etag = _page_etag(versions, request)
+        if trusted:
+            return DocumentResponse(content, headers={'ETag': etag})
+        response.headers['ETag'] = etag
+        return LabelList(**content)
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -304,17 +642,33 @@ def get_labels_from_idea(idea_id: str,
 
 
 @router.get("/{idea_id}/files")
-def get_files_from_idea(idea_id: str,
-                        pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                        db=Depends(get_mongodb_session)) -> FileList:
+async def get_files_from_idea(idea_id: str,
+                              pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                              request: Request,
+                              response: Response,
+                              db=Depends(get_mongodb_session),
+                              trusted=Depends(get_trusted_reads)) -> FileList:
     try:
         query = {'idea_id': ObjectId(idea_id)}
-        found = db['files'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+        not_modified = await _page_not_modified(db, 'files', query, pagination, request)
+        if not_modified is not None:
+            return not_modified
+        found = _find_page(db, 'files', query, pagination)
         data = []
-        for f in found:
-            data.append(FiletRead(**convert(f)))
-        return FileList(data=data, query=convert(query),
-                        pagination=pagination.to_dict({'count': len(data)}))
+        versions = []
+        last = None
+        async for f in found:
+            versions.append((f['_id'], f.get('modified_ts')))
+            data.append(to_document(f) if trusted else FiletRead(**convert(f)))
+            last = f
+        content = dict(data=data, query=convert(query),
+                       pagination=pagination.to_dict({'count': len(data),
+                                                       'next_cursor': pagination.next_cursor(last, len(data))}))
+        etag = _page_etag(versions, request)
+        if trusted:
+            return DocumentResponse(content, headers={'ETag': etag})
+        response.headers['ETag'] = etag
+        return FileList(**content)
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -4,15 +4,18 @@ from typing import Annotated
 
 from bson import ObjectId
 from bson.errors import InvalidId
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from ..models import convert
+from ..models import convert, timestamp
+from ..models.codec import DocumentResponse, to_document, stream_documents, EXPORT_BATCH_SIZE
+from ..models.bulk import BulkResult, BULK_MAX_ITEMS
 from ..models.error import ErrorResponseMessage
 from ..models.label import LabelRead, LabelUpdate, LabelList
 from ..models.http import pagination_params, PaginationParameter, sorting_params, SortingParameter, to_query
-from ..dependencies import get_mongodb_session
+from ..bulk import BulkItem, insert_bulk
+from ..dependencies import get_document_cache, get_mongodb_session, get_trusted_reads
 
 logger = logging.getLogger(__name__)
 
@@ -27,10 +30,11 @@ router = APIRouter(
 
 
 @router.post("/")
-def create_label(label: LabelUpdate, db=Depends(get_mongodb_session)) -> LabelUpdate:
+async def create_label(label: LabelUpdate, db=Depends(get_mongodb_session),
+                       cache=Depends(get_document_cache)) -> LabelUpdate:
     try:
         json = jsonable_encoder(label)
-        now = datetime.now()
+        now = timestamp()
         json['created_ts'] = now
         json['modified_ts'] = now
 
@@ -45,7 +49,7 @@ def create_label(label: LabelUpdate, db=Depends(get_mongodb_session)) -> LabelUp
             return JSONResponse(content=resp, status_code=400)
 
         if label.idea_id is not None:
-            if db['ideas'].find_one({'_id': ObjectId(label.idea_id)}) is None:
+            if await cache.find_one(db, 'ideas', ObjectId(label.idea_id)) is None:
                 resp = jsonable_encoder(
                     ErrorResponseMessage(
                         error="ID_ERROR",
@@ -56,7 +60,7 @@ def create_label(label: LabelUpdate, db=Depends(get_mongodb_session)) -> LabelUp
                 return JSONResponse(content=resp, status_code=404)
             json['idea_id'] = ObjectId(label.idea_id)
         if label.file_id is not None:
-            if db['files'].find_one({'_id': ObjectId(label.file_id)}) is None:
+            if await cache.find_one(db, 'files', ObjectId(label.file_id)) is None:
                 resp = jsonable_encoder(
                     ErrorResponseMessage(
                         error="ID_ERROR",
@@ -67,8 +71,9 @@ def create_label(label: LabelUpdate, db=Depends(get_mongodb_session)) -> LabelUp
                 return JSONResponse(content=resp, status_code=404)
             json['file_id'] = ObjectId(label.file_id)
 
-        new = db['labels'].insert_one(json)
-        data = convert(db['labels'].find_one({'_id': new.inserted_id}))
+        new = await db['labels'].insert_one(json)
+        json['_id'] = new.inserted_id
+        data = convert(json)
         return LabelUpdate(**data)
     except InvalidId as ex:
         resp = jsonable_encoder(
@@ -81,10 +86,45 @@ def create_label(label: LabelUpdate, db=Depends(get_mongodb_session)) -> LabelUp
         return JSONResponse(content=resp, status_code=400)
 
 
+@router.post("/bulk")
+async def create_labels_bulk(labels: Annotated[list[LabelUpdate], Body(max_length=BULK_MAX_ITEMS)],
+                             db=Depends(get_mongodb_session)) -> BulkResult:
+    now = timestamp()
+    items = []
+    for i, label in enumerate(labels):
+        item = BulkItem(i)
+        items.append(item)
+        if label.idea_id is None and label.file_id is None:
+            item.fail(400, ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"Missing ID",
+                detail=f"Provide 'idea_id' or 'file_id'"
+            ))
+            continue
+        try:
+            json = jsonable_encoder(label)
+            json['created_ts'] = now
+            json['modified_ts'] = now
+            if label.idea_id is not None:
+                json['idea_id'] = ObjectId(label.idea_id)
+                item.add_parent('ideas', 'idea_id', json['idea_id'])
+            if label.file_id is not None:
+                json['file_id'] = ObjectId(label.file_id)
+                item.add_parent('files', 'file_id', json['file_id'])
+            item.document = json
+        except InvalidId as ex:
+            item.fail(400, ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"ID has not a valid format",
+                detail=str(ex)
+            ))
+    return await insert_bulk(db, 'labels', items)
+
+
 @router.delete("/{label_id}")
-def delete_label(label_id: str, db=Depends(get_mongodb_session)):
+async def delete_label(label_id: str, db=Depends(get_mongodb_session)):
     try:
-        db['labels'].delete_one({'_id': ObjectId(label_id)})
+        await db['labels'].delete_one({'_id': ObjectId(label_id)})
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -97,7 +137,7 @@ def delete_label(label_id: str, db=Depends(get_mongodb_session)):
 
 
 @router.get("/")
-def get_labels(
+async def get_labels(
         pagination: Annotated[PaginationParameter, Depends(pagination_params)],
         sorting: Annotated[SortingParameter, Depends(sorting_params)],
         correlation_id: str | None = None,
@@ -109,20 +149,48 @@ def get_labels(
         after_created_ts: datetime | None = None,
         before_modified_ts: datetime | None = None,
         after_modified_ts: datetime | None = None,
-        db=Depends(get_mongodb_session)) -> LabelList:
+        db=Depends(get_mongodb_session),
+        trusted=Depends(get_trusted_reads)) -> LabelList:
     query = to_query(correlation_id=correlation_id, idea_id=idea_id, file_id=file_id, value=value, type=type,
                      before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
                      before_created_ts=before_created_ts, after_created_ts=after_created_ts)
 
     logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}")
-    if sorting.is_set():
-        found = db['labels'].find(query).sort(*sorting.get_sort_param()).limit(pagination.limit).skip(
-            pagination.offset * pagination.limit)
-    else:
-        found = db['labels'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+    found = db['labels'].find(pagination.to_query(query, sorting)).sort(pagination.to_sort(sorting)).limit(
+        pagination.limit).skip(pagination.get_skip())
     data = []
-    for f in found:
-        data.append(LabelRead(**convert(f)))
-    return LabelList(data=data, query=convert(query),
-                     pagination=pagination.to_dict({'count': len(data)}),
-                     sorting=sorting.to_dict())
+    last = None
+    async for f in found:
+        data.append(to_document(f) if trusted else LabelRead(**convert(f)))
+        last = f
+    content = dict(data=data, query=convert(query),
+                   pagination=pagination.to_dict({'count': len(data),
+                                                   'next_cursor': pagination.next_cursor(last, len(data), sorting)}),
+                   sorting=sorting.to_dict())
+    if trusted:
+        return DocumentResponse(content)
+    return LabelList(**content)
+
+
+@router.get("/export")
+async def export_labels(
+        sorting: Annotated[SortingParameter, Depends(sorting_params)],
+        correlation_id: str | None = None,
+        idea_id: str | None = None,
+        file_id: str | None = None,
+        value: str | None = None,
+        type: str | None = None,
+        before_created_ts: datetime | None = None,
+        after_created_ts: datetime | None = None,
+        before_modified_ts: datetime | None = None,
+        after_modified_ts: datetime | None = None,
+        db=Depends(get_mongodb_session)):
+    query = to_query(correlation_id=correlation_id, idea_id=idea_id, file_id=file_id, value=value, type=type,
+                     before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
+                     before_created_ts=before_created_ts, after_created_ts=after_created_ts)
+
+    logger.debug(f"export query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}")
+    found = db['labels'].find(query, None).batch_size(EXPORT_BATCH_SIZE)
+    if sorting.is_set():
+        found = found.sort(*sorting.get_sort_param())
+    return StreamingResponse(content=stream_documents(found), media_type="application/x-ndjson")
@@ -4,15 +4,18 @@ from typing import Annotated
 
 from bson import ObjectId
 from bson.errors import InvalidId
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from ..models import convert
+from ..models import convert, timestamp
+from ..models.codec import DocumentResponse, to_document, stream_documents, EXPORT_BATCH_SIZE
+from ..models.bulk import BulkResult, BULK_MAX_ITEMS
 from ..models.error import ErrorResponseMessage
 from ..models.reference import ReferenceRead, ReferenceList, ReferenceUpdate
 from ..models.http import pagination_params, PaginationParameter, sorting_params, SortingParameter, to_query
-from ..dependencies import get_mongodb_session
+from ..bulk import BulkItem, insert_bulk
+from ..dependencies import get_document_cache, get_mongodb_session, get_trusted_reads
 
 logger = logging.getLogger(__name__)
 
@@ -27,10 +30,11 @@ router = APIRouter(
 
 
 @router.post("/")
-def create_reference(reference: ReferenceUpdate, db=Depends(get_mongodb_session)) -> ReferenceRead:
+async def create_reference(reference: ReferenceUpdate, db=Depends(get_mongodb_session),
+                           cache=Depends(get_document_cache)) -> ReferenceRead:
     try:
         json = jsonable_encoder(reference)
-        now = datetime.now()
+        now = timestamp()
         json['created_ts'] = now
         json['modified_ts'] = now
 
@@ -45,7 +49,7 @@ def create_reference(reference: ReferenceUpdate, db=Depends(get_mongodb_session)
             return JSONResponse(content=resp, status_code=400)
 
         if reference.target_idea_id is not None:
-            if db['ideas'].find_one({'_id': ObjectId(reference.target_idea_id)}) is None:
+            if await cache.find_one(db, 'ideas', ObjectId(reference.target_idea_id)) is None:
                 resp = jsonable_encoder(
                     ErrorResponseMessage(
                         error="ID_ERROR",
@@ -57,7 +61,7 @@ def create_reference(reference: ReferenceUpdate, db=Depends(get_mongodb_session)
             json['target_idea_id'] = ObjectId(reference.target_idea_id)
 
         if reference.source_idea_id is not None:
-            if db['ideas'].find_one({'_id': ObjectId(reference.source_idea_id)}) is None:
+            if await cache.find_one(db, 'ideas', ObjectId(reference.source_idea_id)) is None:
                 resp = jsonable_encoder(
                     ErrorResponseMessage(
                         error="ID_ERROR",
@@ -68,8 +72,9 @@ def create_reference(reference: ReferenceUpdate, db=Depends(get_mongodb_session)
                 return JSONResponse(content=resp, status_code=404)
             json['source_idea_id'] = ObjectId(reference.source_idea_id)
 
-        new = db['references'].insert_one(json)
-        data = convert(db['references'].find_one({'_id': new.inserted_id}))
+        new = await db['references'].insert_one(json)
+        json['_id'] = new.inserted_id
+        data = convert(json)
         return ReferenceRead(**data)
     except InvalidId as ex:
         resp = jsonable_encoder(
@@ -82,10 +87,45 @@ def create_reference(reference: ReferenceUpdate, db=Depends(get_mongodb_session)
         return JSONResponse(content=resp, status_code=400)
 
 
+@router.post("/bulk")
+async def create_references_bulk(references: Annotated[list[ReferenceUpdate], Body(max_length=BULK_MAX_ITEMS)],
+                                 db=Depends(get_mongodb_session)) -> BulkResult:
+    now = timestamp()
+    items = []
+    for i, reference in enumerate(references):
+        item = BulkItem(i)
+        items.append(item)
+        if reference.target_idea_id is None and reference.source_idea_id is None:
+            item.fail(400, ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"Missing ID",
+                detail=f"Provide 'target_idea_id' or 'source_idea_id'"
+            ))
+            continue
+        try:
+            json = jsonable_encoder(reference)
+            json['created_ts'] = now
+            json['modified_ts'] = now
+            if reference.target_idea_id is not None:
+                json['target_idea_id'] = ObjectId(reference.target_idea_id)
+                item.add_parent('ideas', 'target_idea_id', json['target_idea_id'])
+            if reference.source_idea_id is not None:
+                json['source_idea_id'] = ObjectId(reference.source_idea_id)
+                item.add_parent('ideas', 'source_idea_id', json['source_idea_id'])
+            item.document = json
+        except InvalidId as ex:
+            item.fail(400, ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"ID has not a valid format",
+                detail=str(ex)
+            ))
+    return await insert_bulk(db, 'references', items)
+
+
 @router.delete("/{reference_id}")
-def delete_reference(reference_id: str, db=Depends(get_mongodb_session)):
+async def delete_reference(reference_id: str, db=Depends(get_mongodb_session)):
     try:
-        db['references'].delete_one({'_id': ObjectId(reference_id)})
+        await db['references'].delete_one({'_id': ObjectId(reference_id)})
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -98,7 +138,7 @@ def delete_reference(reference_id: str, db=Depends(get_mongodb_session)):
 
 
 @router.get("/")
-def get_references(
+async def get_references(
         pagination: Annotated[PaginationParameter, Depends(pagination_params)],
         sorting: Annotated[SortingParameter, Depends(sorting_params)],
         correlation_id: str | None = None,
@@ -109,21 +149,48 @@ def get_references(
         after_created_ts: datetime | None = None,
         before_modified_ts: datetime | None = None,
         after_modified_ts: datetime | None = None,
-        db=Depends(get_mongodb_session)) -> ReferenceList:
+        db=Depends(get_mongodb_session),
+        trusted=Depends(get_trusted_reads)) -> ReferenceList:
 
     query = to_query(correlation_id=correlation_id, target_idea_id=target_idea_id, source_idea_id=source_idea_id, type=type,
                      before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
                      before_created_ts=before_created_ts, after_created_ts=after_created_ts)
 
     logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}")
-    if sorting.is_set():
-        found = db['idea_references'].find(query).sort(*sorting.get_sort_param()).limit(pagination.limit).skip(
-            pagination.offset * pagination.limit)
-    else:
-        found = db['references'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+    found = db['references'].find(pagination.to_query(query, sorting)).sort(pagination.to_sort(sorting)).limit(
+        pagination.limit).skip(pagination.get_skip())
     data = []
-    for f in found:
-        data.append(ReferenceRead(**convert(f)))
-    return ReferenceList(data=data, query=convert(query),
-                         pagination=pagination.to_dict({'count': len(data)}),
-                         sorting=sorting.to_dict())
+    last = None
+    async for f in found:
+        data.append(to_document(f) if trusted else ReferenceRead(**convert(f)))
+        last = f
+    content = dict(data=data, query=convert(query),
+                   pagination=pagination.to_dict({'count': len(data),
+                                                   'next_cursor': pagination.next_cursor(last, len(data), sorting)}),
+                   sorting=sorting.to_dict())
+    if trusted:
+        return DocumentResponse(content)
+    return ReferenceList(**content)
+
+
+@router.get("/export")
+async def export_references(
+        sorting: Annotated[SortingParameter, Depends(sorting_params)],
+        correlation_id: str | None = None,
+        target_idea_id: str | None = None,
+        source_idea_id: str | None = None,
+        type: str | None = None,
+        before_created_ts: datetime | None = None,
+        after_created_ts: datetime | None = None,
+        before_modified_ts: datetime | None = None,
+        after_modified_ts: datetime | None = None,
+        db=Depends(get_mongodb_session)):
+    query = to_query(correlation_id=correlation_id, target_idea_id=target_idea_id, source_idea_id=source_idea_id,
+                     type=type, before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
+                     before_created_ts=before_created_ts, after_created_ts=after_created_ts)
+
+    logger.debug(f"export query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}")
+    found = db['references'].find(query, None).batch_size(EXPORT_BATCH_SIZE)
+    if sorting.is_set():
+        found = found.sort(*sorting.get_sort_param())
+    return StreamingResponse(content=stream_documents(found), media_type="application/x-ndjson")
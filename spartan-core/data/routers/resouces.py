@@ -3,12 +3,14 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends
 
-from ..models import convert
 from ..models.error import ErrorResponseMessage
 from ..models.context import ContextList, ContextRead
-from ..models.idea import IdeaList, IdeaRead
-from ..models.http import pagination_params, PaginationParameter, SortingParameter, sorting_params
-from ..dependencies import get_mongodb_session
+from ..models.idea import IdeaList
+from ..models.http import pagination_params, PaginationParameter, SortingParameter, sorting_params, \
+    ProjectionParameter, projection_params, ExpandParameter, expand_params
+from ..contexts import read_counts
+from ..dependencies import get_mongodb_session, get_trusted_reads
+from .ideas import read_idea_page
 
 logger = logging.getLogger(__name__)
 
@@ -23,37 +25,23 @@ router = APIRouter(
 
 
 @router.get("/")
-def read_resources(db=Depends(get_mongodb_session)) -> ContextList:
-    pipeline = [
-        {"$match": {"resource": {"$ne": None}}},
-        {"$group": {"_id": "$resource", "count": {"$sum": 1}}}
-    ]
-    found = db['ideas'].aggregate(pipeline)
-    projects = []
-    for f in found:
-        projects.append(ContextRead(**convert(f)))
-    return ContextList(data=projects, context='resource')
+async def read_resources(db=Depends(get_mongodb_session)) -> ContextList:
+    data = [ContextRead(**c) for c in await read_counts(db, 'resource')]
+    return ContextList(data=data, context='resource')
 
 
 @router.get("/{resources:path}")
-def get_ideas_by_resource(pagination: Annotated[PaginationParameter, Depends(pagination_params)],
-                          sorting: Annotated[SortingParameter, Depends(sorting_params)], resource_name: str,
-                          exact_match: bool = True, db=Depends(get_mongodb_session)) -> IdeaList:
+async def get_ideas_by_resource(pagination: Annotated[PaginationParameter, Depends(pagination_params)],
+                                sorting: Annotated[SortingParameter, Depends(sorting_params)],
+                                projection: Annotated[ProjectionParameter, Depends(projection_params)],
+                                expand: Annotated[ExpandParameter, Depends(expand_params)],
+                                resource_name: str, exact_match: bool = True, db=Depends(get_mongodb_session),
+                                trusted=Depends(get_trusted_reads)) -> IdeaList:
     if exact_match:
         query = {"resource": resource_name}
     else:
         query = {"resource": {"$regex": f"{resource_name}"}}
 
-    logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}")
-    if sorting.is_set():
-        found = db['ideas'].find(query).sort(*sorting.get_sort_param()).limit(pagination.limit).skip(
-            pagination.offset * pagination.limit)
-    else:
-        found = db['ideas'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
-
-    ideas = []
-    for f in found:
-        ideas.append(IdeaRead(**convert(f)))
-    return IdeaList(data=ideas, query=query,
-                    pagination=pagination.to_dict({'count': len(ideas)}),
-                    sorting=sorting.to_dict())
+    logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}, "
+                 f"projection {projection}, expand {expand}")
+    return await read_idea_page(db, query, pagination, sorting, projection, expand, trusted)
@@ -4,15 +4,18 @@ from typing import Annotated
 
 from bson import ObjectId
 from bson.errors import InvalidId
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 
-from ..models import convert
+from ..models import convert, timestamp
+from ..models.codec import DocumentResponse, to_document
+from ..models.bulk import BulkResult, BULK_MAX_ITEMS
 from ..models.error import ErrorResponseMessage
 from ..models.source import IdeaSourceRead, IdeaSourceUpdate, IdeaSourceList
 from ..models.http import pagination_params, PaginationParameter, sorting_params, SortingParameter, to_query
-from ..dependencies import get_mongodb_session
+from ..bulk import BulkItem, insert_bulk
+from ..dependencies import get_document_cache, get_mongodb_session, get_trusted_reads
 
 logger = logging.getLogger(__name__)
 
@@ -27,15 +30,16 @@ router = APIRouter(
 
 
 @router.post("/")
-def create_source(source: IdeaSourceUpdate, db=Depends(get_mongodb_session)) -> IdeaSourceRead:
+async def create_source(source: IdeaSourceUpdate, db=Depends(get_mongodb_session),
+                        cache=Depends(get_document_cache)) -> IdeaSourceRead:
     try:
         json = jsonable_encoder(source)
         json['idea_id'] = ObjectId(source.idea_id)
-        now = datetime.now()
+        now = timestamp()
         json['created_ts'] = now
         json['modified_ts'] = now
 
-        if db['ideas'].find_one({'_id': ObjectId(source.idea_id)}) is None:
+        if await cache.find_one(db, 'ideas', ObjectId(source.idea_id)) is None:
             resp = jsonable_encoder(
                 ErrorResponseMessage(
                     error="ID_ERROR",
@@ -45,8 +49,9 @@ def create_source(source: IdeaSourceUpdate, db=Depends(get_mongodb_session)) ->
             )
             return JSONResponse(content=resp, status_code=404)
 
-        new = db['sources'].insert_one(json)
-        data = convert(db['sources'].find_one({'_id': new.inserted_id}))
+        new = await db['sources'].insert_one(json)
+        json['_id'] = new.inserted_id
+        data = convert(json)
         return IdeaSourceRead(**data)
     except InvalidId as ex:
         resp = jsonable_encoder(
@@ -59,10 +64,34 @@ def create_source(source: IdeaSourceUpdate, db=Depends(get_mongodb_session)) ->
         return JSONResponse(content=resp, status_code=400)
 
 
+@router.post("/bulk")
+async def create_sources_bulk(sources: Annotated[list[IdeaSourceUpdate], Body(max_length=BULK_MAX_ITEMS)],
+                              db=Depends(get_mongodb_session)) -> BulkResult:
+    now = timestamp()
+    items = []
+    for i, source in enumerate(sources):
+        item = BulkItem(i)
+        items.append(item)
+        try:
+            json = jsonable_encoder(source)
+            json['idea_id'] = ObjectId(source.idea_id)
+            json['created_ts'] = now
+            json['modified_ts'] = now
+            item.add_parent('ideas', 'idea_id', json['idea_id'])
+            item.document = json
+        except InvalidId as ex:
+            item.fail(400, ErrorResponseMessage(
+                error="ID_ERROR",
+                message=f"ID has not a valid format",
+                detail=str(ex)
+            ))
+    return await insert_bulk(db, 'sources', items)
+
+
 @router.delete("/{source_id}")
-def delete_source(source_id: str, db=Depends(get_mongodb_session)):
+async def delete_source(source_id: str, db=Depends(get_mongodb_session)):
     try:
-        db['sources'].delete_one({'_id': ObjectId(source_id)})
+        await db['sources'].delete_one({'_id': ObjectId(source_id)})
     except InvalidId as ex:
         resp = jsonable_encoder(
             ErrorResponseMessage(
@@ -75,7 +104,7 @@ def delete_source(source_id: str, db=Depends(get_mongodb_session)):
 
 
 @router.get("/")
-def get_sources(
+async def get_sources(
         pagination: Annotated[PaginationParameter, Depends(pagination_params)],
         sorting: Annotated[SortingParameter, Depends(sorting_params)],
         correlation_id: str | None = None,
@@ -86,20 +115,24 @@ def get_sources(
         after_created_ts: datetime | None = None,
         before_modified_ts: datetime | None = None,
         after_modified_ts: datetime | None = None,
-        db=Depends(get_mongodb_session)) -> IdeaSourceList:
+        db=Depends(get_mongodb_session),
+        trusted=Depends(get_trusted_reads)) -> IdeaSourceList:
     query = to_query(correlation_id=correlation_id, idea_id=idea_id, name=name, url=url,
                      before_modified_ts=before_modified_ts, after_modified_ts=after_modified_ts,
                      before_created_ts=before_created_ts, after_created_ts=after_created_ts)
 
     logger.debug(f"query params: {query}, sorting {sorting}, use_sorting: {sorting.is_set()}, pagination {pagination}")
-    if sorting.is_set():
-        found = db['sources'].find(query).sort(*sorting.get_sort_param()).limit(pagination.limit).skip(
-            pagination.offset * pagination.limit)
-    else:
-        found = db['sources'].find(query).limit(pagination.limit).skip(pagination.offset * pagination.limit)
+    found = db['sources'].find(pagination.to_query(query, sorting)).sort(pagination.to_sort(sorting)).limit(
+        pagination.limit).skip(pagination.get_skip())
     data = []
-    for f in found:
-        data.append(IdeaSourceRead(**convert(f)))
-    return IdeaSourceList(data=data, query=convert(query),
-                          pagination=pagination.to_dict({'count': len(data)}),
-                          sorting=sorting.to_dict())
+    last = None
+    async for f in found:
+        data.append(to_document(f) if trusted else IdeaSourceRead(**convert(f)))
+        last = f
+    content = dict(data=data, query=convert(query),
+                   pagination=pagination.to_dict({'count': len(data),
+                                                   'next_cursor': pagination.next_cursor(last, len(data), sorting)}),
+                   sorting=sorting.to_dict())
+    if trusted:
+        return DocumentResponse(content)
+    return IdeaSourceList(**content)
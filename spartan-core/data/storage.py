@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+from minio.commonconfig import CopySource
+from minio.error import S3Error
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from starlette.concurrency import run_in_threadpool
+from urllib3.exceptions import HTTPError
+
+from .models import timestamp
+
+logger = logging.getLogger("spartan." + __name__)
+
+# minio buffers one part per upload, so this bounds the memory an upload needs (min. 5 MiB)
+S3_PART_SIZE = 10 * 1024 * 1024
+# size of the chunks a download is streamed with
+S3_CHUNK_SIZE = 256 * 1024
+# how long presigned urls are valid
+PRESIGNED_EXPIRES = timedelta(hours=1)
+# minio raises urllib3 errors if the storage cannot be reached
+STORAGE_ERRORS = (S3Error, HTTPError)
+# a blob marked as deleting for longer is taken over by the next upload of the same content
+BLOB_DELETE_TIMEOUT = timedelta(minutes=1)
+BLOB_DELETE_POLL_SECONDS = 0.05
+
+
+class HashingReader:
+    """Wraps a binary file and hashes and counts the bytes while they are read."""
+
+    def __init__(self, raw, hash_type: str = 'sha256'):
+        self._raw = raw
+        self._hash = hashlib.new(hash_type)
+        self.hash_type = hash_type
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._raw.read(size)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def _hash_file(raw, hash_type: str) -> HashingReader:
+    reader = HashingReader(raw, hash_type)
+    while reader.read(S3_CHUNK_SIZE):
+        pass
+    raw.seek(0)
+    return reader
+
+
+async def hash_file(raw, hash_type: str = 'sha256') -> HashingReader:
+    """Hashes a seekable binary file chunk by chunk and rewinds it."""
+    return await run_in_threadpool(_hash_file, raw, hash_type)
+
+
+async def put_stream(s3, bucket: str, name: str, data, content_type: str | None = None):
+    """Streams the binary file into the bucket with a multipart upload of unknown length."""
+    # the minio client is blocking, the upload must not stall the event loop
+    await run_in_threadpool(s3.put_object, bucket, name, data, length=-1, part_size=S3_PART_SIZE,
+                            content_type=content_type or 'application/octet-stream')
+    logger.debug(f"uploaded '{name}' to bucket '{bucket}'")
+
+
+def blob_name(hash_type: str, file_hash: str) -> str:
+    return f"blobs/{hash_type}/{file_hash}"
+
+
+async def store_blob(db, s3, bucket: str, raw, content_type: str | None = None) -> HashingReader:
+    """Stores the content of the file as content addressed blob and adds a reference to it.
+
+    The upload is skipped when a blob with the same hash is already stored.
+    """
+    reader = await hash_file(raw)
+    name = blob_name(reader.hash_type, reader.hexdigest())
+    before = await _reference_blob(db, name, reader.size)
+    if before is not None and before['stored']:
+        logger.debug(f"blob '{name}' already exists, upload skipped")
+        return reader
+
+    try:
+        await put_stream(s3, bucket, name, raw, content_type)
+    except Exception:
+        await release_blob(db, s3, bucket, name)
+        raise
+    await db['blobs'].update_one({'_id': name}, {'$set': {'stored': True}})
+    return reader
+
+
+async def _reference_blob(db, name: str, size: int) -> dict | None:
+    """Adds a reference to the blob document and returns it as it was before, None if it has been created.
+
+    A blob which is deleted by release_blob cannot be referenced, so this waits until its document is removed.
+    """
+    while True:
+        try:
+            return await db['blobs'].find_one_and_update(
+                {'_id': name, 'deleting': None},
+                {'$inc': {'refs': 1}, '$setOnInsert': {'size': size, 'stored': False, 'created_ts': timestamp()}},
+                upsert=True)
+        except DuplicateKeyError:
+            # the document exists but is marked as deleting, a deletion which did not finish in time is taken over
+            await db['blobs'].update_one({'_id': name, 'deleting': {'$lt': timestamp() - BLOB_DELETE_TIMEOUT}},
+                                         {'$set': {'deleting': None, 'stored': False}})
+            await asyncio.sleep(BLOB_DELETE_POLL_SECONDS)
+
+
+async def release_blob(db, s3, bucket: str, name: str):
+    """Removes a reference to the blob, the object is deleted with the last reference."""
+    after = await db['blobs'].find_one_and_update({'_id': name}, {'$inc': {'refs': -1}},
+                                                  return_document=ReturnDocument.AFTER)
+    if after is None or after['refs'] > 0:
+        return
+
+    # only the request which marks the blob deletes the object, store_blob waits until the document is removed
+    marked = await db['blobs'].find_one_and_update({'_id': name, 'refs': {'$lte': 0}, 'deleting': None},
+                                                   {'$set': {'deleting': timestamp()}},
+                                                   return_document=ReturnDocument.AFTER)
+    if marked is None:
+        return
+    try:
+        await run_in_threadpool(s3.remove_object, bucket, name)
+    except S3Error as ex:
+        logger.error(f"could not delete blob '{name}': {ex}")
+    finally:
+        await db['blobs'].delete_one({'_id': name, 'deleting': marked['deleting']})
+
+
+async def open_object(s3, bucket: str, name: str, offset: int = 0, length: int = 0):
+    """Opens the object (or the given byte range of it), the body is not read yet."""
+    return await run_in_threadpool(s3.get_object, bucket, name, offset=offset, length=length)
+
+
+async def stream_object(response, chunk_size: int = S3_CHUNK_SIZE):
+    """Yields the body of an opened object in chunks and releases the connection afterwards."""
+    try:
+        while True:
+            chunk = await run_in_threadpool(response.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def file_object_name(file_id) -> str:
+    return f"files/{file_id}"
+
+
+async def copy_object(s3, bucket: str, source: str, name: str):
+    """Copies the object on the server, minio composes objects larger than 5 GiB from parts."""
+    await run_in_threadpool(s3.copy_object, bucket, name, CopySource(bucket, source))
+
+
+async def remove_object(s3, bucket: str, name: str):
+    try:
+        await run_in_threadpool(s3.remove_object, bucket, name)
+    except S3Error as ex:
+        logger.error(f"could not delete object '{name}': {ex}")
+
+
+def object_name(doc: dict) -> str:
+    # files uploaded with a presigned url keep their own object, all others reference a blob
+    return doc.get('object_name') or blob_name(doc['hash_type'], doc['hash'])
+
+
+async def release_file(db, s3, bucket: str, doc: dict):
+    if 'object_name' not in doc:
+        await release_blob(db, s3, bucket, object_name(doc))
+        return
+    await remove_object(s3, bucket, doc['object_name'])
+
+
+def presigned_expiry() -> datetime:
+    """When urls presigned now expire, timezone aware since mongo reads dates as UTC (e.g. for the TTL of uploads)."""
+    return datetime.now(timezone.utc) + PRESIGNED_EXPIRES
+
+
+async def presign_put(s3, bucket: str, name: str) -> str:
+    return await run_in_threadpool(s3.presigned_put_object, bucket, name, expires=PRESIGNED_EXPIRES)
+
+
+async def presign_get(s3, bucket: str, name: str, content_type: str, filename: str) -> str:
+    response_headers = {
+        'response-content-type': content_type,
+        'response-content-disposition': f"attachment; filename*=UTF-8''{quote(filename)}"
+    }
+    return await run_in_threadpool(s3.presigned_get_object, bucket, name, expires=PRESIGNED_EXPIRES,
+                                   response_headers=response_headers)
+
+
+async def stat_size(s3, bucket: str, name: str) -> int | None:
+    """Returns the size of the object or None if it does not exist."""
+    try:
+        stat = await run_in_threadpool(s3.stat_object, bucket, name)
+        return stat.size
+    except S3Error as ex:
+        if ex.code == 'NoSuchKey':
+            return None
+        raise
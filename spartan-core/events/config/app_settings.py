@@ -26,4 +26,21 @@ class Settings(BaseSettings):
     spartan_s3_endpoint: str = "localhost:9000"
     spartan_s3_access_key: str = "root"
     spartan_s3_secret_key: str = "secret-key"
-    spartan_s3_secure: bool = False
\ No newline at end of file
+    spartan_s3_secure: bool = False
+    spartan_kafka_bootstrap_servers: str = "localhost:9092"
+    # producer batching, see https://github.com/confluentinc/librdkafka/blob/master/CONFIGURATION.md
+    spartan_kafka_linger_ms: int = 20
+    spartan_kafka_batch_size: int = 256 * 1024
+    # none, gzip, snappy, lz4 or zstd
+    spartan_kafka_compression: str = 'lz4'
+    # json, orjson, msgpack (needs the msgpack package) or compact (see encoders.py)
+    spartan_event_encoding: str = 'json'
+    # the resume token is stored every n events or t milliseconds
+    spartan_checkpoint_events: int = 1000
+    spartan_checkpoint_interval_ms: int = 1000
+    # one watcher process per collection instead of a single watcher on the whole database
+    spartan_parallel_watchers: bool = False
+    # only changes of these collections are published
+    spartan_watch_collections: list[str] = ['ideas', 'files', 'labels', 'entities', 'references', 'sources']
+    # prometheus metrics on http://<host>:<port>/metrics, 0 disables them. Parallel watchers use consecutive ports.
+    spartan_metrics_port: int = 9108
@@ -0,0 +1,122 @@
+import struct
+from datetime import datetime
+
+import orjson
+from bson import ObjectId
+
+from model.event import ChangeEvent
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class JsonEncoder:
+    content_type = 'application/json'
+    # encode() gets the ChangeEvent, otherwise the dict of main.create_message
+    from_message = False
+
+    def encode(self, event: ChangeEvent) -> bytes:
+        return event.model_dump_json().encode('utf-8')
+
+
+class OrjsonEncoder:
+    """Same JSON as JsonEncoder, serialized straight from the message without building a ChangeEvent."""
+    content_type = 'application/json'
+    from_message = True
+
+    def encode(self, message: dict) -> bytes:
+        return orjson.dumps(message, default=_default)
+
+
+class MsgpackEncoder:
+    content_type = 'application/msgpack'
+    from_message = False
+
+    def __init__(self):
+        try:
+            import msgpack
+        except ImportError as ex:
+            raise ImportError("the msgpack event encoding needs the msgpack package (pip install msgpack)") from ex
+        self._packer = msgpack.Packer(default=_default, use_bin_type=True)
+
+    def encode(self, event: ChangeEvent) -> bytes:
+        return self._packer.pack(dict(event))
+
+
+class CompactEncoder:
+    """Fixed binary layout for the fields of a ChangeEvent, the schema-less data is appended as JSON.
+
+    version (1 byte) | type (1 byte) | flags (1 byte) | created_ts in ms (8 bytes) |
+    id (12 bytes object id or 2 bytes length + utf-8) | context (2 bytes length + utf-8) | data (JSON, optional)
+    """
+    content_type = 'application/vnd.spartan.event.v1'
+    from_message = False
+
+    VERSION = 1
+    TYPES = ['INSERT', 'UPDATE', 'DELETE']
+    FLAG_OBJECT_ID = 1
+    FLAG_DATA = 2
+    FLAG_TS = 4
+
+    _header = struct.Struct('>BBBq')
+    _length = struct.Struct('>H')
+
+    def encode(self, event: ChangeEvent) -> bytes:
+        flags = 0
+        if event.id is not None and ObjectId.is_valid(event.id):
+            flags |= self.FLAG_OBJECT_ID
+            doc_id = ObjectId(event.id).binary
+        else:
+            doc_id = self._string(event.id)
+        ts = 0
+        if event.created_ts is not None:
+            flags |= self.FLAG_TS
+            ts = int(event.created_ts.timestamp() * 1000)
+        data = b''
+        if event.data is not None:
+            flags |= self.FLAG_DATA
+            data = orjson.dumps(event.data, default=_default)
+
+        return b''.join([self._header.pack(self.VERSION, self.TYPES.index(event.type), flags, ts),
+                         doc_id, self._string(event.context), data])
+
+    def _string(self, value: str | None) -> bytes:
+        raw = b'' if value is None else value.encode('utf-8')
+        return self._length.pack(len(raw)) + raw
+
+    def decode(self, raw: bytes) -> ChangeEvent:
+        version, op_type, flags, ts = self._header.unpack_from(raw)
+        if version != self.VERSION:
+            raise ValueError(f"unsupported event version {version}")
+        pos = self._header.size
+        if flags & self.FLAG_OBJECT_ID:
+            doc_id = str(ObjectId(raw[pos:pos + 12]))
+            pos += 12
+        else:
+            doc_id, pos = self._read_string(raw, pos)
+        context, pos = self._read_string(raw, pos)
+        return ChangeEvent(id=doc_id, context=context, type=self.TYPES[op_type],
+                           created_ts=datetime.fromtimestamp(ts / 1000) if flags & self.FLAG_TS else None,
+                           data=orjson.loads(raw[pos:]) if flags & self.FLAG_DATA else None)
+
+    def _read_string(self, raw: bytes, pos: int) -> tuple:
+        length, = self._length.unpack_from(raw, pos)
+        pos += self._length.size
+        return raw[pos:pos + length].decode('utf-8'), pos + length
+
+
+ENCODERS = {
+    'json': JsonEncoder,
+    'orjson': OrjsonEncoder,
+    'msgpack': MsgpackEncoder,
+    'compact': CompactEncoder
+}
+
+
+def get_encoder(name: str):
+    if name not in ENCODERS:
+        raise ValueError(f"unknown event encoding '{name}', expected one of {list(ENCODERS.keys())}")
+    return ENCODERS[name]()
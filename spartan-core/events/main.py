@@ -1,5 +1,7 @@
 import json
 import logging.config
+import multiprocessing
+import multiprocessing.connection
 import os
 from datetime import datetime, timedelta
 from json import dumps
@@ -8,12 +10,15 @@ import socket
 
 import yaml
 from bson import ObjectId, Timestamp
-from confluent_kafka import Producer, cimpl
+from confluent_kafka import Producer
 from pymongo import MongoClient
 
 from config.app_settings import Settings, VALUE_DEFAULT_DB_NAME
 from model.event import ChangeEvent
 from model import convert, datetime_from_utc_to_local
+from publisher import Publisher, DeliveryError
+from encoders import get_encoder
+from metrics import Metrics, serve_metrics
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 cfg_file = os.path.join(os.path.dirname(dir_path), 'conf', 'log_conf.yaml')
@@ -27,60 +32,129 @@ logger = logging.getLogger("spartan.events")
 settings = Settings()
 
 
-def kafka_publisher_callback(err, msg: cimpl.Message):
-    if err is not None:
-        raise Exception(f"Message delivery failed: {err}")
-    else:
-        logger.info(f"message published key={msg.key()}, topic={msg.topic()}, offset={msg.offset()}")
+# opType https://www.mongodb.com/docs/manual/reference/change-events/
+OPERATION_TYPES = ['insert', 'update', 'delete']
+
+
+def get_pipeline(collection: str | None = None) -> list:
+    """Filters and trims the change events on the server, before they are sent to the daemon."""
+    match = {'operationType': {'$in': OPERATION_TYPES}}
+    if collection is None:
+        # also drops the resume token writes to outbox
+        match['ns.coll'] = {'$in': settings.spartan_watch_collections}
+    return [
+        {'$match': match},
+        # _id is the resume token and must be kept
+        {'$project': {'operationType': 1, 'ns.coll': 1, 'documentKey': 1, 'wallTime': 1,
+                      'updateDescription.updatedFields': 1, 'fullDocument': 1}}
+    ]
 
 
-def get_stream(db, last_resume_token=None):
+def get_stream(db, last_resume_token=None, pipeline=None, start_at: Timestamp | None = None):
     logger.debug("try to get stream")
     if last_resume_token is None:
-        ts = Timestamp(datetime.now() - timedelta(days=7), 1)
+        ts = start_at or Timestamp(datetime.now() - timedelta(days=7), 1)
         logger.info(f"resume token not found will use start_at_operation_time: {ts.as_datetime()}")
-        return db.watch(start_at_operation_time=ts)
+        return db.watch(pipeline, start_at_operation_time=ts)
     else:
         logger.info(f"will try to resume from last token {last_resume_token}")
-        return db.watch(resume_after=last_resume_token)
+        return db.watch(pipeline, resume_after=last_resume_token)
+
+
+def token_id(collection: str | None = None) -> str:
+    # every watcher has its own resume token
+    if collection is None:
+        return 'resume_token'
+    return f"resume_token.{collection}"
 
 
-def process_change_events(db, producer):
-    found = db['outbox'].find_one({'_id': 'resume_token'})
+def process_change_events(db, publisher: Publisher, encoder, collection: str | None = None):
+    found = db['outbox'].find_one({'_id': token_id(collection)})
 
     if found is None:
         last_resume_token = None
+        start_at = None
     else:
-        last_resume_token = found['last_token']
-
-    with get_stream(db, last_resume_token) as stream:
-        for change in stream:
-            event = create_event(change)
-            if event is not None:
-                producer.produce(topic="spartan.events." + event.context,
-                                 value=event.model_dump_json(),
-                                 key=event.id,
-                                 callback=kafka_publisher_callback)
-                producer.flush()
-                resume_token = stream.resume_token
-                store_token(resume_token, db)
-
-
-def store_token(token, db):
+        # a watcher which has not stored a token yet can be seeded with a start time (see seed_tokens)
+        last_resume_token = found.get('last_token')
+        start_at = found.get('start_at')
+
+    source = db if collection is None else db[collection]
+    headers = [('content-type', encoder.content_type.encode('ascii'))]
+    with get_stream(source, last_resume_token, get_pipeline(collection), start_at) as stream:
+        while stream.alive:
+            change = stream.try_next()
+            if change is None:
+                # no changes within the await time, the post batch token can still be checkpointed
+                publisher.skip(stream.resume_token)
+                continue
+
+            publisher.metrics.observe_change(change)
+            message = create_message(change)
+            if message is not None:
+                # encoders that serialize the plain message skip the validation of the ChangeEvent model
+                event = message if encoder.from_message else ChangeEvent(**message)
+                publisher.publish(topic="spartan.events." + message['context'],
+                                  value=encoder.encode(event),
+                                  key=message['id'],
+                                  token=stream.resume_token,
+                                  headers=headers)
+            else:
+                publisher.skip(stream.resume_token)
+
+
+def resume_timestamp(token) -> Timestamp | None:
+    """The cluster time of a resume token, its key string starts with the timestamp type (0x82) and the time."""
+    data = token.get('_data') if isinstance(token, Mapping) else None
+    if not isinstance(data, str) or len(data) < 18 or not data.startswith('82'):
+        return None
+    return Timestamp(int(data[2:10], 16), int(data[10:18], 16))
+
+
+def seed_tokens(db, collections: list[str]):
+    """Starts the watchers of the collections without a token where the database watcher has stopped.
+
+    A token of the database stream cannot resume the stream of a collection, so they start at its cluster time.
+    """
+    found = db['outbox'].find_one({'_id': token_id()})
+    if found is None:
+        return
+    ts = resume_timestamp(found['last_token'])
+    if ts is None:
+        logger.warning(f"cannot read the time of the resume token {found['last_token']}, watchers are not seeded")
+        return
+    for c in collections:
+        r = db['outbox'].update_one({'_id': token_id(c)},
+                                    {'$setOnInsert': {'start_at': ts, 'crated_ts': datetime.now()}}, upsert=True)
+        if r.upserted_id is not None:
+            logger.info(f"watcher {c} starts at {ts.as_datetime()}, where the database watcher has stopped")
+
+
+def store_token(token, db, collection: str | None = None):
     if token is not None:
         logger.debug(f"storing resume token {token}")
-        db['outbox'].replace_one({'_id': 'resume_token'},
+        db['outbox'].replace_one({'_id': token_id(collection)},
                                  {'last_token': token, 'crated_ts': datetime.now()},
                                  upsert=True)
 
 
 def create_event(change_event):
+    message = create_message(change_event)
+    if message is None:
+        return None
+    event = ChangeEvent(**message)
+    logger.debug(f"creating change evnet {event}")
+    return event
+
+
+def create_message(change_event) -> dict | None:
+    """The fields of the ChangeEvent for a change, in the order of the model and with json compatible values."""
     if 'operationType' not in change_event:
         return
 
     op_type = change_event['operationType']
-    # opType https://www.mongodb.com/docs/manual/reference/change-events/
-    if str(op_type).lower() in ['insert', 'update', 'delete'] and change_event['ns']['coll'] != "outbox":
+    # already filtered by the pipeline of the stream, this only guards against other sources of change events
+    if str(op_type).lower() in OPERATION_TYPES and change_event['ns']['coll'] != "outbox":
         logger.debug(f"got {change_event}")
 
         doc_id = change_event['documentKey']['_id']
@@ -99,17 +173,18 @@ def create_event(change_event):
         msg = {
             'id': doc_id, 'context': collection,
             'type': str(op_type).upper(),
-            'created_ts': datetime_from_utc_to_local(timestamp),
-            'data': data
+            'data': data,
+            'created_ts': datetime_from_utc_to_local(timestamp)
         }
-        event = ChangeEvent(**convert(msg))
-        logger.debug(f"creating change evnet {event}")
-        return event
+        return convert(msg)
     else:
         return None
 
 
-if __name__ == '__main__':
+def run(collection: str | None = None, metrics_port: int = 0):
+    """Watches the whole database or a single collection and publishes its change events."""
+    # fails early if the encoding is unknown or its package is missing
+    encoder = get_encoder(settings.spartan_event_encoding)
 
     logger.info(f"init mongodb session...")
     mongodb_client = MongoClient(settings.spartan_mongodb_url)
@@ -117,15 +192,86 @@ if __name__ == '__main__':
     logger.info(f"checking mongodb db...")
     db = mongodb_client.get_default_database(VALUE_DEFAULT_DB_NAME)
 
-    conf = {'bootstrap.servers': 'localhost:9092',
-            'client.id': socket.gethostname()}
+    conf = {'bootstrap.servers': settings.spartan_kafka_bootstrap_servers,
+            'client.id': socket.gethostname(),
+            'linger.ms': settings.spartan_kafka_linger_ms,
+            'batch.size': settings.spartan_kafka_batch_size,
+            'compression.type': settings.spartan_kafka_compression,
+            # keeps the order of the events when batches are retried
+            'enable.idempotence': True}
     producer = Producer(conf)
+    metrics = Metrics(collection or 'database')
+    if metrics_port > 0:
+        serve_metrics(metrics, metrics_port)
+    publisher = Publisher(producer, lambda token: store_token(token, db, collection),
+                          checkpoint_events=settings.spartan_checkpoint_events,
+                          checkpoint_interval_ms=settings.spartan_checkpoint_interval_ms,
+                          metrics=metrics)
 
     try:
-        process_change_events(db, producer)
+        process_change_events(db, publisher, encoder, collection)
     except KeyboardInterrupt as k:
         logger.info("got keyboard interrupt")
     except Exception as e:
         logger.exception(e)
+        raise SystemExit(1)
+    finally:
+        logger.info(f"shutting down watcher {collection or 'database'}")
+        try:
+            publisher.close()
+        except DeliveryError as e:
+            # the events after the stored token are published again after a restart
+            logger.error(e)
+            raise SystemExit(1)
+        finally:
+            mongodb_client.close()
+
+
+def _metrics_port(index: int) -> int:
+    # every watcher process serves its own metrics, on consecutive ports
+    if settings.spartan_metrics_port == 0:
+        return 0
+    return settings.spartan_metrics_port + index
+
+
+def run_parallel(collections: list[str]):
+    """Runs one watcher process per collection, a failing watcher stops the others."""
+    # every process opens its own mongodb and kafka connections, they must not be shared across a fork
+    mongodb_client = MongoClient(settings.spartan_mongodb_url)
+    try:
+        seed_tokens(mongodb_client.get_default_database(VALUE_DEFAULT_DB_NAME), collections)
     finally:
-        logger.info("shutting down")
+        mongodb_client.close()
+
+    processes = [multiprocessing.Process(target=run, args=(c, _metrics_port(i)), name=f"watcher-{c}")
+                 for i, c in enumerate(collections)]
+    for p in processes:
+        p.start()
+    exit_code = None
+    try:
+        stopped = multiprocessing.connection.wait([p.sentinel for p in processes])
+        for p in processes:
+            if p.sentinel in stopped:
+                p.join()
+                logger.error(f"{p.name} stopped with exit code {p.exitcode}")
+                if exit_code is None:
+                    # a watcher never stops on its own, a signal (negative exit code) or 0 is a failure too
+                    exit_code = p.exitcode if p.exitcode is not None and p.exitcode > 0 else 1
+    except KeyboardInterrupt as k:
+        logger.info("got keyboard interrupt")
+    finally:
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+        for p in processes:
+            p.join()
+    if exit_code is not None:
+        # so a supervisor restarts the daemon
+        raise SystemExit(exit_code)
+
+
+if __name__ == '__main__':
+    if settings.spartan_parallel_watchers:
+        run_parallel(settings.spartan_watch_collections)
+    else:
+        run(metrics_port=settings.spartan_metrics_port)
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("spartan.events.metrics")
+
+
+class Metrics:
+    """Metrics of a watcher, rendered in the prometheus text format."""
+
+    # produce to delivery, in seconds
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, watcher: str = 'database'):
+        self.watcher = watcher
+        self._lock = threading.Lock()
+        self._events = Counter()
+        self._lag = 0.0
+        self._latency_buckets = [0] * len(self.LATENCY_BUCKETS)
+        self._latency_sum = 0.0
+        self._latency_count = 0
+        self._delivery_errors = 0
+        self._in_flight = 0
+        self._checkpoints = 0
+        self._last_checkpoint = None
+
+    def observe_change(self, change: dict):
+        wall_time = change.get('wallTime')
+        with self._lock:
+            self._events[(change.get('ns', {}).get('coll'), change.get('operationType'))] += 1
+            if isinstance(wall_time, datetime):
+                # wallTime is decoded as naive utc datetime
+                self._lag = time.time() - wall_time.replace(tzinfo=timezone.utc).timestamp()
+
+    def observe_produce(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def observe_delivery(self, seconds: float | None, failed: bool = False):
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self._delivery_errors += 1
+                return
+            self._latency_sum += seconds
+            self._latency_count += 1
+            for i, bound in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self._latency_buckets[i] += 1
+                    break
+
+    def observe_checkpoint(self):
+        with self._lock:
+            self._checkpoints += 1
+            self._last_checkpoint = time.time()
+
+    def render(self) -> str:
+        w = f'watcher="{self.watcher}"'
+        with self._lock:
+            lines = [
+                "# HELP spartan_events_total Change events received by collection and operation type.",
+                "# TYPE spartan_events_total counter",
+                *[f'spartan_events_total{{{w},collection="{c}",type="{t}"}} {n}' for (c, t), n in self._events.items()],
+                "# HELP spartan_events_lag_seconds Age of the last change event (now - wallTime).",
+                "# TYPE spartan_events_lag_seconds gauge",
+                f"spartan_events_lag_seconds{{{w}}} {self._lag:.3f}",
+                "# HELP spartan_events_delivery_seconds Time from produce to the delivery report.",
+                "# TYPE spartan_events_delivery_seconds histogram",
+            ]
+            cumulative = 0
+            for bound, n in zip(self.LATENCY_BUCKETS, self._latency_buckets):
+                cumulative += n
+                lines.append(f'spartan_events_delivery_seconds_bucket{{{w},le="{bound}"}} {cumulative}')
+            lines += [
+                f'spartan_events_delivery_seconds_bucket{{{w},le="+Inf"}} {self._latency_count}',
+                f"spartan_events_delivery_seconds_sum{{{w}}} {self._latency_sum:.6f}",
+                f"spartan_events_delivery_seconds_count{{{w}}} {self._latency_count}",
+                "# HELP spartan_events_delivery_errors_total Failed deliveries.",
+                "# TYPE spartan_events_delivery_errors_total counter",
+                f"spartan_events_delivery_errors_total{{{w}}} {self._delivery_errors}",
+                "# HELP spartan_events_in_flight Produced events waiting for their delivery report.",
+                "# TYPE spartan_events_in_flight gauge",
+                f"spartan_events_in_flight{{{w}}} {self._in_flight}",
+                "# HELP spartan_events_checkpoints_total Stored resume tokens.",
+                "# TYPE spartan_events_checkpoints_total counter",
+                f"spartan_events_checkpoints_total{{{w}}} {self._checkpoints}",
+            ]
+            if self._last_checkpoint is not None:
+                lines += [
+                    "# HELP spartan_events_checkpoint_age_seconds Time since the last resume token was stored.",
+                    "# TYPE spartan_events_checkpoint_age_seconds gauge",
+                    f"spartan_events_checkpoint_age_seconds{{{w}}} {time.time() - self._last_checkpoint:.3f}",
+                ]
+        return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(metrics: Metrics, port: int) -> ThreadingHTTPServer:
+    """Serves GET /metrics on a background thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name=f"metrics-{metrics.watcher}", daemon=True).start()
+    logger.info(f"serving metrics of watcher {metrics.watcher} on port {port}")
+    return server
@@ -0,0 +1,94 @@
+import logging
+import time
+from collections import deque
+
+from metrics import Metrics
+
+logger = logging.getLogger("spartan.events.publisher")
+
+
+class DeliveryError(Exception):
+    pass
+
+
+class Publisher:
+    """Publishes events without waiting for each delivery and checkpoints the resume token.
+
+    A resume token is only stored once every event before it has been delivered, so after a restart no event is
+    lost (but events after the last checkpoint are published again). Checkpoints are written every
+    checkpoint_events events or checkpoint_interval_ms milliseconds, whatever comes first.
+    """
+
+    def __init__(self, producer, store_token, checkpoint_events: int = 1000, checkpoint_interval_ms: int = 1000,
+                 metrics: Metrics | None = None):
+        self._producer = producer
+        self._store_token = store_token
+        self._checkpoint_events = checkpoint_events
+        self._checkpoint_interval = checkpoint_interval_ms / 1000
+        # [resume_token, delivered] in stream order
+        self._pending = deque()
+        self._error = None
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+        self.last_token = None
+        self.metrics = metrics or Metrics()
+
+    def publish(self, topic: str, key: str, value, token, headers: list | None = None):
+        entry = [token, False]
+        self._pending.append(entry)
+        while True:
+            try:
+                produced = time.perf_counter()
+                self._producer.produce(topic=topic, value=value, key=key, headers=headers,
+                                       on_delivery=lambda err, msg: self._on_delivery(entry, err, msg, produced))
+                break
+            except BufferError:
+                # the local queue is full, wait for deliveries before producing more
+                self._producer.poll(0.1)
+        self.metrics.observe_produce()
+        self._producer.poll(0)
+        self._since_checkpoint += 1
+        self.checkpoint()
+
+    def skip(self, token):
+        """Advances the resume token for a change that is not published."""
+        if token is None:
+            return
+        if len(self._pending) > 0 and self._pending[-1][0] == token:
+            return
+        self._pending.append([token, True])
+        self._producer.poll(0)
+        self.checkpoint()
+
+    def _on_delivery(self, entry, err, msg, produced: float):
+        if err is not None:
+            self._error = err
+            self.metrics.observe_delivery(None, failed=True)
+        else:
+            entry[1] = True
+            self.metrics.observe_delivery(time.perf_counter() - produced)
+            logger.debug(f"message published key={msg.key()}, topic={msg.topic()}, offset={msg.offset()}")
+
+    def checkpoint(self, force: bool = False):
+        if self._error is None and not force and self._since_checkpoint < self._checkpoint_events and \
+                time.monotonic() - self._last_checkpoint < self._checkpoint_interval:
+            return
+
+        token = None
+        while len(self._pending) > 0 and self._pending[0][1]:
+            token = self._pending.popleft()[0]
+        if token is not None and token != self.last_token:
+            self._store_token(token)
+            self.last_token = token
+            self.metrics.observe_checkpoint()
+        self._since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+        if self._error is not None:
+            raise DeliveryError(f"Message delivery failed: {self._error}")
+
+    def close(self, timeout: float = 30):
+        remaining = self._producer.flush(timeout)
+        if remaining > 0:
+            logger.warning(f"{remaining} messages were not delivered before shutdown")
+        self.checkpoint(force=True)
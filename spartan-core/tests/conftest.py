@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+from unittest import mock
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# the data package is imported the way the app is started, from the spartan-core directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+# the events daemon is run from its own directory and uses absolute imports
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'events'))
+
+
+class MemoryStorage:
+    """Just enough of the minio client for the tests, remove_object can be held to interleave other requests."""
+
+    def __init__(self):
+        self.objects = {}
+        self.removing = threading.Event()
+        self.proceed = threading.Event()
+        self.proceed.set()
+
+    def put_object(self, bucket, name, data, length=-1, part_size=0, content_type=None):
+        self.objects[name] = data.read()
+
+    def remove_object(self, bucket, name):
+        self.removing.set()
+        self.proceed.wait(5)
+        self.objects.pop(name, None)
+
+    def presigned_put_object(self, bucket, name, expires=None):
+        return f"http://storage/{bucket}/{name}?method=PUT"
+
+    def presigned_get_object(self, bucket, name, expires=None, response_headers=None):
+        return f"http://storage/{bucket}/{name}"
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()['spartan']
+
+
+@pytest.fixture
+def storage():
+    return MemoryStorage()
+
+
+@pytest.fixture(scope='session')
+def app():
+    # the app checks its bucket when it is imported, the tests replace the storage anyway
+    with mock.patch('minio.Minio.bucket_exists', return_value=True):
+        from data.main import app
+    return app
+
+
+@pytest.fixture
+def client(app, db, storage):
+    """Client of the app on an in-memory database and storage, the startup tasks are not run."""
+    from fastapi.testclient import TestClient
+    from data.cache import DocumentCache
+    from data.dependencies import get_mongodb_session, get_s3_session, get_document_cache
+
+    cache = DocumentCache(max_size=0)
+    app.dependency_overrides[get_mongodb_session] = lambda: db
+    app.dependency_overrides[get_s3_session] = lambda: storage
+    app.dependency_overrides[get_document_cache] = lambda: cache
+    yield TestClient(app)
+    app.dependency_overrides.clear()
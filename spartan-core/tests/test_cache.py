@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from data.cache import DocumentCache, watch_invalidations
+
+
+class FailingWatch:
+    def __init__(self, error: Exception):
+        self.error = error
+        self.calls = 0
+
+    def watch(self, pipeline):
+        self.calls += 1
+        raise self.error
+
+
+def test_unavailable_change_stream_is_retried():
+    # a standalone server does not support change streams
+    db = FailingWatch(OperationFailure("The $changeStream stage is only supported on replica sets", 40573))
+    cache = DocumentCache()
+
+    async def watch():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(watch_invalidations(db, cache, retry_seconds=0.01), 0.2)
+
+    asyncio.run(watch())
+
+    assert db.calls > 1
+    assert not cache.listening
+
+
+def test_other_errors_are_not_hidden():
+    db = FailingWatch(NotImplementedError("watch"))
+
+    with pytest.raises(NotImplementedError):
+        asyncio.run(watch_invalidations(db, DocumentCache(), retry_seconds=0.01))
+
+    assert db.calls == 1
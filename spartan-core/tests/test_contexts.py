@@ -0,0 +1,35 @@
+import asyncio
+
+from data.contexts import rebuild_counts, read_counts, REBUILD_COLLECTION
+
+
+def test_rebuild_replaces_the_counts(db):
+    async def rebuild():
+        await db['ideas'].insert_many([
+            {'tags': ['a', 'b'], 'project': 'p'},
+            {'tags': ['a'], 'project': None},
+        ])
+        # stale counts of values no idea has anymore
+        await db['context_counts'].insert_many([
+            {'context': 'tag', 'value': 'a', 'count': 7},
+            {'context': 'project', 'value': 'gone', 'count': 1},
+        ])
+        await rebuild_counts(db)
+        return await read_counts(db, 'tag'), await read_counts(db, 'project'), await db.list_collection_names(), \
+            await db['context_counts'].index_information()
+
+    tags, projects, collections, indexes = asyncio.run(rebuild())
+
+    assert sorted(tags, key=lambda c: c['id']) == [{'id': 'a', 'count': 2}, {'id': 'b', 'count': 1}]
+    assert projects == [{'id': 'p', 'count': 1}]
+    assert REBUILD_COLLECTION not in collections
+    assert indexes['context_1_value_1']['unique']
+
+
+def test_rebuild_without_ideas_removes_the_counts(db):
+    async def rebuild():
+        await db['context_counts'].insert_one({'context': 'tag', 'value': 'a', 'count': 1})
+        await rebuild_counts(db)
+        return await read_counts(db, 'tag')
+
+    assert asyncio.run(rebuild()) == []
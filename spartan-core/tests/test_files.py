@@ -0,0 +1,24 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from data.storage import PRESIGNED_EXPIRES
+
+
+def test_upload_expires_in_utc(client, db):
+    idea_id = ObjectId()
+    asyncio.run(db['ideas'].insert_one({'_id': idea_id, 'name': 'idea'}))
+    now = datetime.now(timezone.utc)
+
+    response = client.post('/files/uploads', json={'idea_id': str(idea_id), 'name': 'a.txt', 'size': 1,
+                                                   'hash': '0' * 64})
+
+    assert response.status_code == 200
+    returned = datetime.fromisoformat(response.json()['expires_ts'])
+    stored = asyncio.run(db['uploads'].find_one({'_id': ObjectId(response.json()['id'])}))['expires_ts']
+    # mongo returns naive UTC dates, the TTL index compares them with its UTC clock
+    stored = stored if stored.tzinfo is not None else stored.replace(tzinfo=timezone.utc)
+    assert returned.utcoffset() == timedelta(0)
+    assert abs(stored - returned) < timedelta(milliseconds=1)
+    assert abs(stored - (now + PRESIGNED_EXPIRES)) < timedelta(minutes=1)
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from data.models.reference import GRAPH_MAX_EDGES
+
+
+def reference(source_id, target_id) -> dict:
+    now = datetime.now()
+    return {'_id': ObjectId(), 'source_idea_id': source_id, 'target_idea_id': target_id, 'type': 'LINKED',
+            'created_ts': now, 'modified_ts': now}
+
+
+@pytest.fixture
+def cycle(db):
+    """Ideas a -> b -> c -> a."""
+    ideas = {n: ObjectId() for n in 'abc'}
+    refs = [reference(ideas['a'], ideas['b']), reference(ideas['b'], ideas['c']), reference(ideas['c'], ideas['a'])]
+    asyncio.run(db['ideas'].insert_many([{'_id': v, 'name': k} for k, v in ideas.items()]))
+    asyncio.run(db['references'].insert_many(refs))
+    return ideas, refs
+
+
+@pytest.mark.parametrize('direction, depths', [
+    ('out', {'a': 0, 'b': 1, 'c': 2}),
+    ('in', {'a': 0, 'c': 1, 'b': 2}),
+    ('both', {'a': 0, 'b': 1, 'c': 1}),
+])
+def test_cycle_is_walked_once(client, cycle, direction, depths):
+    ideas, refs = cycle
+
+    graph = client.get(f"/ideas/{ideas['a']}/graph", params={'depth': 5, 'direction': direction}).json()
+
+    assert not graph['truncated']
+    assert {n['name']: n['depth'] for n in graph['nodes']} == depths
+    assert sorted(e['id'] for e in graph['edges']) == sorted(str(r['_id']) for r in refs)
+
+
+@pytest.mark.parametrize('direction', ['out', 'in', 'both'])
+def test_fan_out_is_truncated_at_the_edge_cap(client, db, cycle, direction):
+    ideas, refs = cycle
+    # more references than the cap on the root in both directions, all newer than the cycle
+    fan = []
+    for _ in range(GRAPH_MAX_EDGES):
+        fan += [reference(ideas['a'], ObjectId()), reference(ObjectId(), ideas['a'])]
+    asyncio.run(db['references'].insert_many(fan))
+
+    graph = client.get(f"/ideas/{ideas['a']}/graph", params={'depth': 3, 'direction': direction}).json()
+
+    assert graph['truncated']
+    assert len(graph['edges']) == GRAPH_MAX_EDGES
+    # the first hop alone exceeds the cap, its edges are taken by id
+    outgoing = direction in ('out', 'both')
+    incoming = direction in ('in', 'both')
+    first_hop = [r for r in refs + fan if (outgoing and r['source_idea_id'] == ideas['a'])
+                 or (incoming and r['target_idea_id'] == ideas['a'])]
+    assert [e['id'] for e in graph['edges']] == [str(r['_id']) for r in first_hop[:GRAPH_MAX_EDGES]]
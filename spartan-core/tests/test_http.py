@@ -0,0 +1,108 @@
+import warnings
+from datetime import datetime
+
+import orjson
+import pytest
+from bson import ObjectId
+
+from data.models import convert
+from data.models.error import InvalidParameterError
+from data.models.http import ExpandParameter, ProjectionParameter, document_etag, etag_matches, parse_range
+from data.models.idea import IdeaExpandedList, IdeaExpandedRead
+from data.models.label import LabelRead
+
+
+def test_expand_accepts_comma_separated_sub_resources():
+    expand = ExpandParameter(['labels, files', 'references'])
+
+    assert expand.fields == {'labels', 'files', 'references'}
+
+
+def test_expand_rejects_unknown_sub_resources():
+    with pytest.raises(InvalidParameterError) as ex:
+        ExpandParameter(['labels,comments'])
+
+    assert ex.value.detail.startswith("cannot expand ['comments']")
+
+
+def test_expanded_sub_resources_of_partial_ideas_are_models():
+    now = datetime.now()
+    doc = {'_id': ObjectId(), 'name': 'idea',
+           'labels': [{'_id': ObjectId(), 'idea_id': ObjectId(), 'value': 'v', 'type': 't', 'created_ts': now,
+                       'modified_ts': now}]}
+    projection = ProjectionParameter(['name,labels'])
+    expand = ExpandParameter(['labels'])
+
+    idea = projection.to_model(IdeaExpandedRead, expand.validate(IdeaExpandedRead, expand.rename(convert(doc))))
+    with warnings.catch_warnings():
+        # pydantic warns when it serializes a dict in place of a model
+        warnings.simplefilter('error')
+        response = projection.to_response(IdeaExpandedList(data=[idea]))
+
+    assert isinstance(idea.labels[0], LabelRead)
+    label = orjson.loads(response.body)['data'][0]['labels'][0]
+    assert label['id'] == str(doc['labels'][0]['_id'])
+    assert label['value'] == 'v'
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=900-1999', (900, 999)),
+    # open-ended
+    ('bytes=100-', (100, 999)),
+    # suffix, the last n bytes
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+])
+def test_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', [
+    None,
+    'bytes=0-1,5-9',
+    'items=0-99',
+    'bytes=-',
+    'bytes=a-b',
+    'bytes=5-2',
+])
+def test_range_is_ignored(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize('header, size', [
+    ('bytes=1000-', 1000),
+    ('bytes=1000-1200', 1000),
+    ('bytes=-0', 1000),
+    ('bytes=-10', 0),
+])
+def test_range_is_not_satisfiable(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+def test_document_etag_is_strong_and_changes_with_the_modification():
+    doc = {'hash': 'abc', 'modified_ts': datetime(2024, 1, 2, 3, 4, 5, 678901)}
+
+    etag = document_etag(doc)
+
+    assert etag == '"abc-2024-01-02T03:04:05.678"'
+    assert etag != document_etag({**doc, 'modified_ts': datetime(2024, 1, 2, 3, 4, 6)})
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False),
+    ('"abc-1"', True),
+    ('"abc-2"', False),
+    # weak comparison, a weak validator matches the strong etag
+    ('W/"abc-1"', True),
+    ('*', True),
+    (' * ', True),
+    ('"x", "abc-1"', True),
+    ('"x",W/"abc-1"', True),
+    ('"x", "y"', False),
+    # the etag must be quoted
+    ('abc-1', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc-1"') is expected
@@ -0,0 +1,98 @@
+from typing import Annotated
+
+import mongomock
+import pytest
+from bson import ObjectId
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from data.models.error import InvalidParameterError, invalid_parameter_handler
+from data.models.http import PaginationParameter, SortingParameter, pagination_params
+
+
+@pytest.fixture
+def ideas():
+    collection = mongomock.MongoClient().db['ideas']
+    collection.insert_many([
+        {'_id': ObjectId(), 'project': 'p'},
+        {'_id': ObjectId(), 'project': None},
+        {'_id': ObjectId(), 'project': 'p'},
+        {'_id': ObjectId()},
+        {'_id': ObjectId(), 'project': 'q'},
+    ])
+    return collection
+
+
+def walk(collection, sorting: SortingParameter, limit: int) -> tuple[list, int]:
+    """Follows the cursors like a client, returns the ids in page order and the number of requests."""
+    ids = []
+    after = None
+    requests = 0
+    while True:
+        pagination = PaginationParameter(offset=0, limit=limit, after=after)
+        page = list(collection.find(pagination.to_query({}, sorting)).sort(pagination.to_sort(sorting))
+                    .limit(pagination.limit).skip(pagination.get_skip()))
+        requests += 1
+        ids += [d['_id'] for d in page]
+        after = pagination.next_cursor(page[-1] if len(page) > 0 else None, len(page), sorting)
+        if after is None:
+            return ids, requests
+
+
+@pytest.mark.parametrize('sort_by', ['project', 'id'])
+@pytest.mark.parametrize('sort_order', ['asc', 'desc'])
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_walk_returns_every_document_once_in_sort_order(ideas, sort_by, sort_order, limit):
+    sorting = SortingParameter(sort_by=sort_by, sort_order=sort_order)
+    expected = [d['_id'] for d in ideas.find().sort(PaginationParameter(0, 1).to_sort(sorting))]
+
+    ids, _ = walk(ideas, sorting, limit)
+
+    assert ids == expected
+
+
+def test_descending_keyset_includes_missing_and_null_values(ideas):
+    sorting = SortingParameter(sort_by='project', sort_order='desc')
+
+    ids, _ = walk(ideas, sorting, 1)
+
+    assert len(ids) == 5
+    assert [ideas.find_one({'_id': i}).get('project') for i in ids] == ['q', 'p', 'p', None, None]
+
+
+def test_no_cursor_after_a_short_page(ideas):
+    _, requests = walk(ideas, SortingParameter(sort_by=None, sort_order=None), 2)
+
+    assert requests == 3
+
+
+def test_cursor_after_a_full_page():
+    pagination = PaginationParameter(offset=0, limit=2)
+
+    assert pagination.next_cursor({'_id': ObjectId()}, 2) is not None
+    assert pagination.next_cursor({'_id': ObjectId()}, 1) is None
+    assert pagination.next_cursor(None, 0) is None
+
+
+def test_cursor_for_another_sort_key_is_rejected():
+    after = PaginationParameter(0, 1).next_cursor({'_id': ObjectId(), 'name': 'a'}, 1,
+                                                  SortingParameter(sort_by='name', sort_order='asc'))
+    pagination = PaginationParameter(offset=0, limit=1, after=after)
+
+    with pytest.raises(InvalidParameterError):
+        pagination.to_query({}, SortingParameter(sort_by='project', sort_order='asc'))
+
+
+def test_invalid_cursor_is_answered_with_an_error_message():
+    app = FastAPI()
+    app.add_exception_handler(InvalidParameterError, invalid_parameter_handler)
+
+    @app.get("/")
+    async def read(pagination: Annotated[PaginationParameter, Depends(pagination_params)]):
+        return pagination.to_dict()
+
+    response = TestClient(app).get("/", params={'after': 'not a cursor'})
+
+    assert response.status_code == 400
+    assert response.json() == {'error': 'PARAMETER_ERROR', 'message': 'Cursor has not a valid format',
+                               'detail': "cursor 'not a cursor' is not valid"}
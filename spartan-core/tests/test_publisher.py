@@ -0,0 +1,180 @@
+import time
+from unittest import mock
+
+import pytest
+
+import main as events
+from publisher import Publisher, DeliveryError
+from benchmarks.events_bench import ReplayDatabase, change_documents
+
+
+class StubMessage:
+    def __init__(self, topic, key):
+        self._topic = topic
+        self._key = key
+
+    def topic(self):
+        return self._topic
+
+    def key(self):
+        return self._key
+
+    def offset(self):
+        return 0
+
+
+class StubProducer:
+    """Kafka producer stand-in whose deliveries are triggered by the test, in any order."""
+
+    def __init__(self, fail_keys=(), deliver_on_poll: bool = False):
+        self.produced = {}
+        self.sent = 0
+        self._fail_keys = set(fail_keys)
+        self._deliver_on_poll = deliver_on_poll
+
+    def produce(self, topic, value, key=None, headers=None, on_delivery=None):
+        self.produced[key] = (on_delivery, StubMessage(topic, key))
+        self.sent += 1
+
+    def deliver(self, key, err=None):
+        on_delivery, msg = self.produced.pop(key)
+        on_delivery(err, msg)
+
+    def poll(self, timeout: float = 0):
+        if not self._deliver_on_poll:
+            return 0
+        return self.flush()
+
+    def flush(self, timeout: float | None = None) -> int:
+        # delivers everything still in flight, the keys given as failing are not delivered
+        n = len(self.produced)
+        for key in list(self.produced.keys()):
+            self.deliver(key, 'broker unavailable' if key in self._fail_keys else None)
+        return n
+
+
+def publish(publisher: Publisher, *keys):
+    for k in keys:
+        publisher.publish('spartan.events.ideas', k, b'{}', f"token-{k}")
+
+
+def test_checkpoint_waits_for_every_earlier_delivery():
+    producer = StubProducer()
+    tokens = []
+    publisher = Publisher(producer, tokens.append, checkpoint_events=1)
+
+    publish(publisher, 1, 2, 3)
+    producer.deliver(3)
+    producer.deliver(2)
+    publisher.checkpoint(force=True)
+    assert tokens == []
+
+    producer.deliver(1)
+    publisher.checkpoint(force=True)
+    assert tokens == ['token-3']
+
+
+def test_checkpoint_stops_at_the_first_undelivered_event():
+    producer = StubProducer()
+    tokens = []
+    publisher = Publisher(producer, tokens.append)
+
+    publish(publisher, 1, 2, 3)
+    producer.deliver(1)
+    producer.deliver(3)
+    publisher.checkpoint(force=True)
+
+    assert tokens == ['token-1']
+
+
+def test_skipped_changes_advance_the_token_only_after_earlier_deliveries():
+    producer = StubProducer()
+    tokens = []
+    publisher = Publisher(producer, tokens.append)
+
+    publish(publisher, 1)
+    publisher.skip('token-skipped')
+    publisher.checkpoint(force=True)
+    assert tokens == []
+
+    producer.deliver(1)
+    publisher.checkpoint(force=True)
+    assert tokens == ['token-skipped']
+
+
+def test_checkpoint_after_the_number_of_events():
+    producer = StubProducer()
+    tokens = []
+    publisher = Publisher(producer, tokens.append, checkpoint_events=3, checkpoint_interval_ms=60_000)
+
+    publish(publisher, 1, 2)
+    producer.deliver(1)
+    producer.deliver(2)
+    assert tokens == []
+
+    publish(publisher, 3)
+    assert tokens == ['token-2']
+
+
+def test_checkpoint_after_the_interval():
+    producer = StubProducer()
+    tokens = []
+    publisher = Publisher(producer, tokens.append, checkpoint_events=1000, checkpoint_interval_ms=20)
+
+    publish(publisher, 1)
+    producer.deliver(1)
+    publisher.checkpoint()
+    assert tokens == []
+
+    time.sleep(0.03)
+    publisher.checkpoint()
+    assert tokens == ['token-1']
+
+
+def test_failed_delivery_stores_the_last_safe_token_and_raises():
+    producer = StubProducer()
+    tokens = []
+    publisher = Publisher(producer, tokens.append, checkpoint_events=1000, checkpoint_interval_ms=60_000)
+
+    publish(publisher, 1, 2, 3)
+    producer.deliver(1)
+    producer.deliver(2, 'broker unavailable')
+    producer.deliver(3)
+
+    with pytest.raises(DeliveryError):
+        publisher.checkpoint()
+    assert tokens == ['token-1']
+
+
+class ReplayOutbox(ReplayDatabase):
+    """Replays the changes and records the stored resume tokens."""
+
+    def __init__(self, changes: list):
+        super().__init__(changes)
+        self.tokens = []
+
+    def replace_one(self, query, doc, upsert=False):
+        self.tokens.append(doc['last_token'])
+
+
+def run_daemon(changes: list, producer: StubProducer) -> ReplayOutbox:
+    db = ReplayOutbox(changes)
+    with mock.patch.object(events, 'MongoClient') as client, \
+            mock.patch.object(events, 'Producer', return_value=producer):
+        client.return_value.get_default_database.return_value = db
+        with pytest.raises(SystemExit) as ex:
+            events.run('ideas')
+    assert ex.value.code == 1
+    return db
+
+
+@pytest.mark.parametrize('deliver_on_poll, sent', [(True, 3), (False, 5)], ids=['while streaming', 'on shutdown'])
+def test_failed_delivery_stops_the_daemon(deliver_on_poll, sent):
+    changes = change_documents(5)
+    producer = StubProducer(fail_keys=[str(changes[2]['documentKey']['_id'])], deliver_on_poll=deliver_on_poll)
+
+    db = run_daemon(changes, producer)
+
+    # nothing at or after the failed event is checkpointed
+    assert db.tokens[-1] == changes[1]['_id']
+    assert producer.sent == sent
@@ -0,0 +1,70 @@
+import asyncio
+import io
+from datetime import timedelta
+
+from data.models import timestamp
+from data.storage import store_blob, release_blob, blob_name
+
+BUCKET = 'spartan'
+
+
+def test_blob_is_stored_once_and_deleted_with_the_last_reference(db, storage):
+    async def run():
+        reader = await store_blob(db, storage, BUCKET, io.BytesIO(b'content'))
+        await store_blob(db, storage, BUCKET, io.BytesIO(b'content'))
+        name = blob_name(reader.hash_type, reader.hexdigest())
+        refs = (await db['blobs'].find_one({'_id': name}))['refs']
+        await release_blob(db, storage, BUCKET, name)
+        stored = name in storage.objects
+        await release_blob(db, storage, BUCKET, name)
+        return name, refs, stored
+
+    name, refs, stored = asyncio.run(run())
+
+    assert refs == 2
+    assert stored
+    assert name not in storage.objects
+
+
+def test_upload_during_the_deletion_of_the_blob_is_stored_again(db, storage):
+    async def run():
+        reader = await store_blob(db, storage, BUCKET, io.BytesIO(b'content'))
+        name = blob_name(reader.hash_type, reader.hexdigest())
+
+        # the last reference is released, the object is removed while the same content is uploaded again
+        storage.proceed.clear()
+        release = asyncio.create_task(release_blob(db, storage, BUCKET, name))
+        while not storage.removing.is_set():
+            await asyncio.sleep(0.01)
+        upload = asyncio.create_task(store_blob(db, storage, BUCKET, io.BytesIO(b'content')))
+        await asyncio.sleep(0.2)
+        waiting = not upload.done()
+        storage.proceed.set()
+        await release
+        await upload
+        return name, waiting, await db['blobs'].find_one({'_id': name})
+
+    name, waiting, doc = asyncio.run(run())
+
+    assert waiting
+    assert storage.objects[name] == b'content'
+    assert doc['refs'] == 1
+    assert doc['stored']
+
+
+def test_abandoned_deletion_is_taken_over(db, storage):
+    async def run():
+        reader = await store_blob(db, storage, BUCKET, io.BytesIO(b'content'))
+        name = blob_name(reader.hash_type, reader.hexdigest())
+        # a release which marked the blob and never finished
+        await db['blobs'].update_one({'_id': name}, {'$set': {'refs': 0, 'deleting': timestamp() - timedelta(hours=1)}})
+        storage.objects.clear()
+        await store_blob(db, storage, BUCKET, io.BytesIO(b'content'))
+        return name, await db['blobs'].find_one({'_id': name})
+
+    name, doc = asyncio.run(run())
+
+    assert storage.objects[name] == b'content'
+    assert doc['refs'] == 1
+    assert doc['stored']
+    assert doc['deleting'] is None
@@ -0,0 +1,50 @@
+from unittest import mock
+
+import mongomock
+from bson import Timestamp
+
+import main as events
+from benchmarks.events_bench import ReplayStream
+
+# a resume token as stored by the database watcher, at cluster time 1666276652 (increment 1)
+DATABASE_TOKEN = {'_data': '8263515D2C000000012B022C0100296E5A1004F9E8F1B6C6B14A8E8A3D6E5B2C1F7B2D46645F696400646351'}
+
+
+def test_resume_timestamp():
+    assert events.resume_timestamp(DATABASE_TOKEN) == Timestamp(1666276652, 1)
+    assert events.resume_timestamp({'_data': 'not a key string'}) is None
+    assert events.resume_timestamp(None) is None
+
+
+def test_watchers_without_token_are_seeded_from_the_database_token():
+    db = mongomock.MongoClient().db
+    db['outbox'].insert_many([
+        {'_id': events.token_id(), 'last_token': DATABASE_TOKEN},
+        {'_id': events.token_id('files'), 'last_token': {'_data': 'own token'}},
+    ])
+
+    events.seed_tokens(db, ['ideas', 'files'])
+
+    assert db['outbox'].find_one({'_id': events.token_id('ideas')})['start_at'] == Timestamp(1666276652, 1)
+    assert db['outbox'].find_one({'_id': events.token_id('files')}) == {'_id': events.token_id('files'),
+                                                                         'last_token': {'_data': 'own token'}}
+
+
+def test_nothing_is_seeded_without_a_database_token():
+    db = mongomock.MongoClient().db
+
+    events.seed_tokens(db, ['ideas'])
+
+    assert db['outbox'].count_documents({}) == 0
+
+
+def test_seeded_watcher_starts_at_the_seeded_time():
+    db = mongomock.MongoClient().db
+    db['outbox'].insert_one({'_id': events.token_id('ideas'), 'start_at': Timestamp(1666276652, 1)})
+
+    with mock.patch.object(events, 'get_stream', return_value=ReplayStream([])) as get_stream:
+        events.process_change_events(db, mock.Mock(), mock.Mock(content_type='application/json'), 'ideas')
+
+    source, token, _, start_at = get_stream.call_args.args
+    assert token is None
+    assert start_at == Timestamp(1666276652, 1)